@@ -9,9 +9,10 @@ logwood.basic_config(
 
 SUPPORTED_POLICY_TYPES = {
     'action' : ['most-visited','proportional-to-visit-count'],
-    'selection': ['ucb1', 'puct'],
-    'expansion' : ['vanilla','neural'],
-    'simulation' : ['to-end'],
-    'update' : ['vanilla', 'value'],
-    'expansion_rollout': ['random-unvisited','random']
+    'selection': ['ucb1', 'puct', 'solver-ucb1', 'rave-ucb1'],
+    'expansion' : ['vanilla','neural','progressive','progressive-neural'],
+    'simulation' : ['to-end', 'vectorized-random-to-end'],
+    'update' : ['vanilla', 'value', 'solver', 'rave'],
+    'expansion_rollout': ['random-unvisited','random'],
+    'early_stop': ['visit-margin']
 }
@@ -4,6 +4,7 @@ from .policies.selection import *
 from .policies.update import *
 from .policies.rollout import *
 from .policies.simulation import *
+from .policies.stopping import *
 import inspect
 
 
@@ -14,14 +15,33 @@ class ConfigBuilder:
             "most-visited": MostVisited,
             "proportional-to-visit-count": ProportionalToVisitCount,
         },
-        "selection": {"ucb1": UCB1, "puct": PUCT},
-        "expansion": {"vanilla": VanillaExpansion, "neural": NNExpansion},
-        "simulation": {"random-to-end": RandomToEnd},
-        "update": {"vanilla": VanillaUpdate, "value": ValueUpdate},
+        "selection": {
+            "ucb1": UCB1,
+            "puct": PUCT,
+            "solver-ucb1": SolverUCB1,
+            "rave-ucb1": RAVEUCB1,
+        },
+        "expansion": {
+            "vanilla": VanillaExpansion,
+            "neural": NNExpansion,
+            "progressive": ProgressiveExpansion,
+            "progressive-neural": ProgressiveNNExpansion,
+        },
+        "simulation": {
+            "random-to-end": RandomToEnd,
+            "vectorized-random-to-end": VectorizedRandomToEnd,
+        },
+        "update": {
+            "vanilla": VanillaUpdate,
+            "value": ValueUpdate,
+            "solver": SolverUpdate,
+            "rave": RAVEUpdate,
+        },
         "expansion_rollout": {
-            "random": RandomChoice,
+            "random": RandomEdge,
             "random-unvisited": RandomUnvisited,
         },
+        "early_stop": {"visit-margin": VisitMarginStop},
     }
 
     @classmethod
@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+
+
+class EvaluationCache:
+    """A least-recently-used cache of model evaluations, keyed by node id.
+
+    Node ids are the state digests of the tree, so a position reached again in a
+    later search or game is found even after `MCTS.reset()`. The cache holds the
+    evaluations of a single model version. When it is used with a different model,
+    or the model's `version` changes because its weights were updated, it is cleared.
+
+    The cache is thread safe and may be shared by the searches of several MCTS
+    that use the same model."""
+
+    def __init__(self, max_size=100000):
+        """Initializes an EvaluationCache.
+
+        Keyword Arguments:
+            max_size {int} -- Maximum number of evaluations kept (default: {100000})
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._model = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0
+
+        return self.hits / lookups
+
+    def get(self, model, key):
+        """Looks up the evaluation of a state by `model`.
+
+        Arguments:
+            model {mcts.nn.model.Model} -- The model that would evaluate the state
+            key {hashable} -- The id of the state's node
+
+        Returns:
+            tuple -- The cached priors and value, or None on a miss
+        """
+        with self._lock:
+            self._validate(model)
+            evaluation = self._entries.get(key)
+            if evaluation is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return evaluation
+
+    def put(self, model, key, evaluation):
+        """Stores the evaluation of a state by `model`, evicting the least recently used one if full."""
+        with self._lock:
+            self._validate(model)
+            self._entries[key] = evaluation
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Removes all evaluations. The hit and miss counts are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def _validate(self, model):
+        version = getattr(model, "version", 0)
+        if model is not self._model or version != self._version:
+            self._entries.clear()
+            self._model = model
+            self._version = version
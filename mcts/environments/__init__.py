@@ -1,4 +1,4 @@
-from .tictactoe import TicTacToe
-from .dotsandboxes import DotsAndBoxes
+from .tictactoe import TicTacToe, VecTicTacToe
+from .dotsandboxes import DotsAndBoxes, VecDotsAndBoxes
 
-__all__ = ["TicTacToe", "DotsAndBoxes"]
+__all__ = ["TicTacToe", "DotsAndBoxes", "VecTicTacToe", "VecDotsAndBoxes"]
@@ -5,12 +5,147 @@ Created on Sat Apr  8 21:52:43 2017
 
 import numpy as np
 from collections import defaultdict
-from numpy import random
-from copy import deepcopy
+from .symmetry import dihedral_maps, gather_indices
+
+# Wall and cell tables, generated once per board size
+_BOARD_TABLES = {}
+
+# Symmetry tables, generated once per board size
+_SYMMETRY_TABLES = {}
+
+# Vectorized playout tables, generated once per board size
+_PLAYOUT_TABLES = {}
+
+
+def _board_table(size):
+    """Returns the tables that relate the walls and cells of a board.
+
+    Walls are numbered as actions: the N-S walls row by row, then the E-W walls row
+    by row. Cells are numbered row by row.
+
+    Returns:
+        tuple -- The (row, column, side) state entries of each wall, the bitmask of the four
+            walls of each cell, and the wall on each side (N, S, E, W) of each cell as an
+            array of shape (size, size, 4)
+    """
+    if size not in _BOARD_TABLES:
+        n_horizontal = size * (size + 1)
+        side_walls = np.zeros([size, size, 4], dtype=np.int64)
+        for row in range(size):
+            for column in range(size):
+                side_walls[row, column] = [
+                    row * size + column,
+                    (row + 1) * size + column,
+                    n_horizontal + row * (size + 1) + column + 1,
+                    n_horizontal + row * (size + 1) + column,
+                ]
+
+        cell_masks = []
+        wall_entries = [[] for _ in range(2 * n_horizontal)]
+        for cell, walls in enumerate(side_walls.reshape(-1, 4).tolist()):
+            cell_masks.append(sum(1 << w for w in walls))
+            for side, w in enumerate(walls):
+                wall_entries[w].append(divmod(cell, size) + (side,))
+
+        _BOARD_TABLES[size] = (wall_entries, cell_masks, side_walls)
+
+    return _BOARD_TABLES[size]
+
+
+def _symmetry_table(size):
+    """Returns the image of each wall, and the wall and state gather indices, for the 8 symmetries of the board."""
+    if size not in _SYMMETRY_TABLES:
+        n_horizontal = size * (size + 1)
+
+        def wall(a, b):
+            # The wall between two neighbouring dots
+            (r1, c1), (r2, c2) = sorted([a, b])
+            if r1 == r2:
+                return r1 * size + c1
+            return n_horizontal + r1 * (size + 1) + c1
+
+        def dots(wall_number):
+            if wall_number < n_horizontal:
+                r, c = divmod(wall_number, size)
+                return (r, c), (r, c + 1)
+            r, c = divmod(wall_number - n_horizontal, size + 1)
+            return (r, c), (r + 1, c)
+
+        def cell_walls(r, c):
+            # The walls of a cell, in the order of the state channels N, S, E, W
+            return [
+                wall((r, c), (r, c + 1)),
+                wall((r + 1, c), (r + 1, c + 1)),
+                wall((r, c + 1), (r + 1, c + 1)),
+                wall((r, c), (r + 1, c)),
+            ]
+
+        walls, states = [], []
+        for f in dihedral_maps(size):
+            walls.append([wall(*[f(*dot) for dot in dots(w)]) for w in range(2 * n_horizontal)])
+
+            # Each channel of a cell moves to the channel of the image cell for the image wall
+            images = np.zeros([size, size, 5], dtype=int)
+            for r in range(size):
+                for c in range(size):
+                    corners = [f(r, c), f(r + 1, c + 1)]
+                    r2, c2 = min(p[0] for p in corners), min(p[1] for p in corners)
+                    image_walls = cell_walls(r2, c2)
+                    for side, w in enumerate(cell_walls(r, c)):
+                        images[r, c, side] = np.ravel_multi_index(
+                            (r2, c2, image_walls.index(walls[-1][w])), images.shape
+                        )
+                    images[r, c, 4] = np.ravel_multi_index((r2, c2, 4), images.shape)
+            states.append(images.ravel())
+
+        walls = np.array(walls)
+        _SYMMETRY_TABLES[size] = (
+            walls,
+            gather_indices(walls),
+            gather_indices(np.array(states)),
+        )
+
+    return _SYMMETRY_TABLES[size]
+
+
+def _playout_table(size):
+    """Returns the walls of each cell and the cells of each wall as arrays, for vectorized playouts.
+
+    Walls on the edge of the board have a single cell. They are padded with an extra
+    cell, whose four walls are all an extra wall that is never built.
+
+    Returns:
+        tuple -- The walls of each cell as an array of shape (size * size + 1, 4), and the
+            cells of each wall as an array of shape (walls, 2)
+    """
+    if size not in _PLAYOUT_TABLES:
+        wall_entries, _, side_walls = _board_table(size)
+        n_walls = len(wall_entries)
+        n_cells = size * size
+
+        cell_walls = np.concatenate(
+            [side_walls.reshape(n_cells, 4), np.full([1, 4], n_walls)]
+        )
+        wall_cells = np.full([n_walls, 2], n_cells)
+        for w, entries in enumerate(wall_entries):
+            for i, (row, column, _) in enumerate(entries):
+                wall_cells[w, i] = row * size + column
+
+        _PLAYOUT_TABLES[size] = (cell_walls, wall_cells)
+
+    return _PLAYOUT_TABLES[size]
 
 
 class DotsAndBoxes:
-    """The main environment for a dots and boxes game"""
+    """The main environment for a dots and boxes game
+
+    The walls that have been built are kept as an integer bitmask, where bit i is
+    set once wall i is built. Tables of the walls around each cell make the check
+    for completed boxes O(1). The `state` array is updated in place, and is only
+    copied on the next move once it has been read."""
+
+    # `step` and `push` accept observe=False to skip the observation
+    lazy_observations = True
 
     def __init__(self, size=4):
         """
@@ -20,8 +155,6 @@ class DotsAndBoxes:
 
         self.size = size
 
-        # State is dot-to-dot cells with 5 channels (up,down,left,right, none)
-        self.state = np.zeros([size, size, 5])
         self.player = 1
         self.n_players = 2
         self.score = defaultdict(int)
@@ -31,8 +164,27 @@ class DotsAndBoxes:
         self.reward_dictionary = {"win": 1, "loss": -1, "draw": 0}
         self.captured_cells = defaultdict(list)
         self.SIDES = {"N": 0, "S": 1, "E": 2, "W": 3}
+        self._wall_entries, self._cell_masks, self._side_walls = _board_table(size)
         self.reset()
 
+    @property
+    def state(self):
+        """State is dot-to-dot cells with 5 channels (up,down,left,right, none)"""
+        # The array may now be kept by the caller, so the next change is made on a copy
+        self._state_shared = True
+        return self._state
+
+    @property
+    def action_mask(self):
+        """A boolean array of size `action_space` that is True for valid actions. It must not be modified."""
+        self._mask_shared = True
+        return self._mask
+
+    @property
+    def hash_key(self):
+        """A key that uniquely identifies the walls built and the player on move."""
+        return self._walls | (self.player - 1) << self.action_space
+
     def switch_turn(self):
         """Switches the turn"""
         if self.player == 1:
@@ -49,41 +201,152 @@ class DotsAndBoxes:
             self.winner = self.player
             return self.reward_dictionary["win"]
         else:
-            self.winner = 2 if self.player == 1 else 2
+            self.winner = 2 if self.player == 1 else 1
             return self.reward_dictionary["loss"]
 
-    def step(self, action):
-        """Takes an action and changes the game state."""
-        # If an action is invalid and the environment is set to quit
-        # on an invalid action, set the reward to loss and return
-        # the terminal state. Otherwise, simply return the state without
-        # switching turns, to give the player another chance.
+    def step(self, action, observe=True):
+        """Takes an action and changes the game state.
+
+        Returns the observation, reward and done flag, or only the reward and done
+        flag if `observe` is False."""
+        # Wall bitmasks grow past 64 bits, so actions must be Python ints
+        action = int(action)
         if not self.is_valid_action(action):
             raise ValueError("Invalid Action: {}".format(action))
 
+        # Add a wall where the action dictates
+        self.build_wall(action)
+
+        # Determine the score of the action
+        scored = self.score_action(action)
+        # Remove the action from the list of valid actions
+        self._remove_action(action)
+
+        # Payout rewards
+        reward = 0
+        if not self.actions:
+            reward = self.end_game()
+            done = True
+
+        else:
+            done = False
+            if not scored:
+                self.switch_turn()
+
+        if observe:
+            return self.state, reward, done
+        return reward, done
+
+    def push(self, action, observe=True):
+        """Takes a step that can be undone with `pop`."""
+        action = int(action)
+        self._undo.append(
+            (
+                action,
+                self._positions[action],
+                self.player,
+                self.score[self.player],
+                self.terminal,
+                self.winner,
+            )
+        )
+        return self.step(action, observe)
+
+    def pop(self):
+        """Undoes the last step taken with `push`."""
+        action, position, player, score, self.terminal, self.winner = self._undo.pop()
+
+        self._walls ^= 1 << action
+        self._writable_mask()[action] = True
+        state = self._writable_state()
+        for row, column, side in self._wall_entries[action]:
+            state[row, column, side] = 0
+            if not self._walls & self._cell_masks[row * self.size + column]:
+                state[row, column, 4] = 1
+
+        # Put the action back where it was in the list of valid actions
+        actions = self.actions
+        if position < len(actions):
+            moved = actions[position]
+            self._positions[moved] = len(actions)
+            actions.append(moved)
+            actions[position] = action
         else:
-            last_state = np.copy(self.state)
+            actions.append(action)
+        self._positions[action] = position
 
-            # Add a wall where the action dictates
-            self.build_wall(action)
+        # Remove any boxes the step completed
+        captured = self.score[player] - score
+        if captured:
+            del self.captured_cells[player][-captured:]
+            self.score[player] = score
 
-            # Determine the score of the action
-            scored = self.score_action(action)
-            # Remove the action from the list of valid actions
-            self.actions.remove(action)
+        self.player = player
 
-            # Payout rewards
-            reward = 0
-            if self.actions == []:
-                reward = self.end_game()
-                done = True
+    @property
+    def pushes(self):
+        """The number of steps that can be undone with `pop`."""
+        return len(self._undo)
 
-            else:
-                done = False
-                if not scored:
-                    self.switch_turn()
+    def random_playouts(self, count):
+        """Plays `count` games of random moves to the end at once, without changing the environment.
 
-            return self.state, reward, done
+        The move order of each game is a random permutation of the remaining walls, drawn
+        up front. The games are then played together, one wall of every game per step,
+        and a player who completes a box moves again.
+
+        Arguments:
+            count {int} -- The number of games
+
+        Returns:
+            numpy.array -- The winner of each game, or 0 for a draw
+        """
+        if self.terminal:
+            return np.full(count, self.winner or 0)
+
+        cell_walls, wall_cells = _playout_table(self.size)
+        actions = np.array(self.actions)
+        order = actions[np.argsort(np.random.random_sample((count, len(actions))), axis=1)]
+
+        games = np.arange(count)
+        built = np.zeros([count, self.action_space + 1], dtype=bool)
+        built[:, :-1] = ~self._mask
+        scores = np.tile([self.score[1], self.score[2]], (count, 1))
+        players = np.full(count, self.player - 1)
+        for turn in range(len(actions)):
+            walls = order[:, turn]
+            built[games, walls] = True
+
+            # Count the cells next to each new wall that now have all four walls
+            cells = cell_walls[wall_cells[walls]]
+            scored = built[games[:, None, None], cells].all(axis=2).sum(axis=1)
+            scores[games, players] += scored
+            players ^= scored == 0
+
+        lead = scores[:, 0] - scores[:, 1]
+        return np.where(lead > 0, 1, np.where(lead < 0, 2, 0))
+
+    @property
+    def symmetries(self):
+        """The action permutation of each symmetry of the board, starting with the identity."""
+        return _symmetry_table(self.size)[0]
+
+    def transform_state(self, state, symmetry):
+        """Returns `state` transformed by the symmetry with index `symmetry`."""
+        indices = _symmetry_table(self.size)[2][symmetry]
+        return state.reshape(-1)[indices].reshape(state.shape)
+
+    def canonical_key(self):
+        """Returns the smallest `hash_key` among the symmetric variants of the position, and the
+        index of the symmetry that gives it. The variants are built from the action mask, without the state."""
+        built = ~self._mask[_symmetry_table(self.size)[1]]
+        packed = np.packbits(built, axis=1, bitorder="little")
+        data, width = packed.tobytes(), packed.shape[1]
+        player = (self.player - 1) << self.action_space
+        return min(
+            (int.from_bytes(data[g * width : (g + 1) * width], "little") | player, g)
+            for g in range(len(packed))
+        )
 
     def score_action(self, action):
         """
@@ -91,89 +354,105 @@ class DotsAndBoxes:
         :param action: The integer representing the wall to be built
         :return: True if action scored, false otherwise
         """
-        states = self.convert_to_state(action)
         scored = False
-        for state_index in states:
-            cell_row, cell_column = state_index[:2]
-            if np.sum(self.state[cell_row, cell_column]) == 4:
-                self.captured_cells[self.player].append([cell_row, cell_column])
+        for row, column, _ in self._wall_entries[action]:
+            mask = self._cell_masks[row * self.size + column]
+            if self._walls & mask == mask:
+                self.captured_cells[self.player].append([row, column])
                 self.score[self.player] += 1
                 scored = True
 
         return scored
 
     def reset(self):
-        self.actions = [i for i in range(self.size * (self.size + 1) * 2)]
+        self.actions = list(range(self.action_space))
+        self._positions = list(range(self.action_space))
         self.score = defaultdict(int)
-        self.state = np.zeros([self.size, self.size, 5])
-        self.state[:, :, 4] = np.ones([self.size, self.size])
+        self.captured_cells = defaultdict(list)
+        self._walls = 0
+        self._state = np.zeros([self.size, self.size, 5])
+        self._state[:, :, 4] = 1
+        self._state_shared = False
+        self._mask = np.ones(self.action_space, dtype=bool)
+        self._mask_shared = False
         self.winner = None
         self.player = 1
         self.terminal = False
+        self._undo = []
 
     def build_wall(self, action):
         """Builds a wall in the game state"""
-        states = self.convert_to_state(action)
-        for state_index in states:
-            row, column, side = state_index
-            self.state[row, column, side] = 1
-            self.state[row, column, 4] = 0
+        action = int(action)
+        self._walls |= 1 << action
+        self._writable_mask()[action] = False
+        state = self._writable_state()
+        for row, column, side in self._wall_entries[action]:
+            state[row, column, side] = 1
+            state[row, column, 4] = 0
 
     def convert_to_wall(self, state):
         """Converts a specific game state array to the wall it represents"""
         row, column, side = state
-        if side == self.SIDES["N"]:
-            return row * self.size + column
-        elif side == self.SIDES["S"]:
-            return (row + 1) * self.size + column
-        elif side == self.SIDES["E"]:
-            return (self.size * (self.size + 1)) + row * self.size + column
-        elif side == self.SIDES["W"]:
-            return (self.size * (self.size + 1)) + row * self.size + (column + 1)
-        else:
+        if side not in self.SIDES.values():
             raise ValueError(
                 "Can't convert state to wall. 3rd Dimension must be range [0-3]. Value given: {}".format(
                     side
                 )
             )
 
+        return int(self._side_walls[row, column, side])
+
     def convert_to_state(self, wall_number):
         """Converts a wall number to the specific game states that it represents"""
-        cells = []
-        # If this is true, the wall is on the N-S
-        if wall_number < ((self.size) * (self.size + 1)):
-            cell_column = wall_number % self.size
-            cell_row = wall_number // self.size
-            if cell_row != 0:
-                cells.append([cell_row - 1, cell_column, self.SIDES["S"]])
-            if cell_row != self.size:
-                cells.append([cell_row, cell_column, self.SIDES["N"]])
-        # Otherwise the wall is E-W
-        else:
-            cell_row = (wall_number - (self.size * (self.size + 1))) // (self.size + 1)
-            cell_column = wall_number % (self.size + 1)
-            if cell_column != 0:
-                cells.append([cell_row, cell_column - 1, self.SIDES["E"]])
-
-            if cell_column != self.size:
-                cells.append([cell_row, cell_column, self.SIDES["W"]])
-
-        return cells
+        return [list(entry) for entry in self._wall_entries[wall_number]]
 
     def is_valid_action(self, action):
         """Ensures that an action is valid"""
-        states = self.convert_to_state(action)
-        for state_index in states:
-            r, c, s = state_index
-            if self.state[r, c, s] == 1:
-                return False
-        return True
+        return 0 <= action < self.action_space and not self._walls >> int(action) & 1
 
     def board(self):
         print(self)
 
+    def vectorized(self, n):
+        """Returns a `VecDotsAndBoxes` of `n` new games on a board of the same size."""
+        return VecDotsAndBoxes(n, self.size)
+
     def clone(self):
-        return deepcopy(self)
+        # The tables are shared, and so are the state and mask arrays until either side changes them
+        self._state_shared = True
+        self._mask_shared = True
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        clone.actions = self.actions[:]
+        clone._positions = self._positions[:]
+        clone.score = self.score.copy()
+        clone.captured_cells = defaultdict(
+            list, {player: cells[:] for player, cells in self.captured_cells.items()}
+        )
+        clone._undo = self._undo[:]
+        return clone
+
+    def _writable_state(self):
+        """Returns the state array, copying it first if it may be kept elsewhere."""
+        if self._state_shared:
+            self._state = np.copy(self._state)
+            self._state_shared = False
+        return self._state
+
+    def _writable_mask(self):
+        """Returns the action mask, copying it first if it may be kept elsewhere."""
+        if self._mask_shared:
+            self._mask = np.copy(self._mask)
+            self._mask_shared = False
+        return self._mask
+
+    def _remove_action(self, action):
+        """Removes an action from the list of valid actions by swapping in the last one."""
+        position = self._positions[action]
+        last = self.actions.pop()
+        if last != action:
+            self.actions[position] = last
+            self._positions[last] = position
 
     def __str__(self):
         """Provides a console output of the current state"""
@@ -279,3 +558,107 @@ class DotsAndBoxes:
         )
 
         return string
+
+
+class VecDotsAndBoxes:
+    """N dots and boxes games held in stacked arrays and stepped together.
+
+    Each game is a row of the array of built walls and of the array of box owners.
+    `player`, `terminal` and `winner` hold the values of every game, with a winner
+    of 0 for games without one."""
+
+    def __init__(self, n, size=4):
+        self.n_envs = n
+        self.size = size
+        self.n_players = 2
+        self.action_space = size * (size + 1) * 2
+        self._cell_walls, self._wall_cells = _playout_table(size)
+        self.reset()
+
+    @property
+    def action_mask(self):
+        """A boolean array of shape (n, action_space) that is True for the valid actions of each game."""
+        return ~self._built[:, :-1]
+
+    @property
+    def state(self):
+        """The states of all games, stacked in an array of shape (n, size, size, 5)."""
+        walls = self._built[:, self._cell_walls[:-1]]
+        state = np.concatenate([walls, ~walls.any(axis=2, keepdims=True)], axis=2)
+        return state.reshape([-1, self.size, self.size, 5]).astype(float)
+
+    def step(self, actions, observe=True):
+        """Takes an action in every game that has not ended. The actions of other games are ignored.
+
+        Returns the observations, rewards and done flags of all games, or only the
+        rewards and done flags if `observe` is False. As in `DotsAndBoxes`, the reward
+        of the move that ends a game is that of the player who made it."""
+        actions = np.asarray(actions)
+        games = np.flatnonzero(~self.terminal)
+        walls = actions[games]
+        if not self.action_mask[games, walls].all():
+            raise ValueError("Invalid Actions: {}".format(actions))
+        self._built[games, walls] = True
+
+        # Cells next to each new wall that now have all four walls are captured
+        cells = self._wall_cells[walls]
+        captured = self._built[games[:, None, None], self._cell_walls[cells]].all(axis=2)
+        players = self.player[games]
+        rows, sides = np.nonzero(captured)
+        self._owners[games[rows], cells[rows, sides]] = players[rows]
+        scored = captured.sum(axis=1)
+        self.score[games, players - 1] += scored
+
+        rewards = np.zeros(self.n_envs, dtype=int)
+        done = self._built[games, :-1].all(axis=1)
+        ended = games[done]
+        if len(ended):
+            lead = self.score[ended, 0] - self.score[ended, 1]
+            self.winner[ended] = np.where(lead > 0, 1, np.where(lead < 0, 2, 0))
+            self.terminal[ended] = True
+            drawn = self.winner[ended] == 0
+            rewards[ended] = np.where(drawn, 0, np.where(self.winner[ended] == players[done], 1, -1))
+
+        # A player who captured a box moves again
+        switch = games[~done & (scored == 0)]
+        self.player[switch] = 3 - self.player[switch]
+
+        if observe:
+            return self.state, rewards, self.terminal.copy()
+        return rewards, self.terminal.copy()
+
+    def reset(self, indices=None):
+        """Starts new games, in place of the games at `indices` or of all games."""
+        if indices is None:
+            # The last column is the padding wall of the playout tables, which is never built
+            self._built = np.zeros([self.n_envs, self.action_space + 1], dtype=bool)
+            self._owners = np.zeros([self.n_envs, self.size * self.size], dtype=int)
+            self.score = np.zeros([self.n_envs, 2], dtype=int)
+            self.player = np.ones(self.n_envs, dtype=int)
+            self.terminal = np.zeros(self.n_envs, dtype=bool)
+            self.winner = np.zeros(self.n_envs, dtype=int)
+            return
+
+        self._built[indices] = False
+        self._owners[indices] = 0
+        self.score[indices] = 0
+        self.player[indices] = 1
+        self.terminal[indices] = False
+        self.winner[indices] = 0
+
+    def environment(self, index):
+        """Returns a `DotsAndBoxes` in the position of the game at `index`."""
+        environment = DotsAndBoxes(self.size)
+        for wall in np.flatnonzero(self._built[index, :-1]).tolist():
+            environment.build_wall(wall)
+            environment._remove_action(wall)
+
+        for cell in np.flatnonzero(self._owners[index]).tolist():
+            player = int(self._owners[index, cell])
+            environment.captured_cells[player].append(list(divmod(cell, self.size)))
+            environment.score[player] += 1
+
+        environment.player = int(self.player[index])
+        environment.terminal = bool(self.terminal[index])
+        environment.winner = int(self.winner[index]) or None
+        return environment
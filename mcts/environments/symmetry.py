@@ -0,0 +1,30 @@
+import numpy as np
+
+
+def dihedral_maps(n):
+    """Returns the 8 symmetries of a square grid of points.
+
+    Each symmetry is a function that maps the (row, column) coordinates of a point,
+    each in the range [0, n], to those of its image. The identity comes first."""
+    return [
+        lambda r, c: (r, c),
+        lambda r, c: (c, n - r),
+        lambda r, c: (n - r, n - c),
+        lambda r, c: (n - c, r),
+        lambda r, c: (r, n - c),
+        lambda r, c: (n - r, c),
+        lambda r, c: (c, r),
+        lambda r, c: (n - c, n - r),
+    ]
+
+
+def gather_indices(images):
+    """Converts maps from each index to the index of its image into gather indices.
+
+    Arguments:
+        images {numpy.array} -- An array of shape (symmetries, size) holding the image of each index
+
+    Returns:
+        numpy.array -- Indices such that `x[indices[g]]` is `x` transformed by symmetry `g`
+    """
+    return np.argsort(images, axis=1)
@@ -1,9 +1,43 @@
 import numpy as np
-from copy import deepcopy
+from .symmetry import dihedral_maps, gather_indices
+
+# Each player's pieces are kept as a bitboard, where bit i is set if the player holds cell i
+_FULL = (1 << 9) - 1
+_LINES = (
+    [0b000000111 << 3 * row for row in range(3)]
+    + [0b001001001 << column for column in range(3)]
+    + [0b100010001, 0b001010100]
+)
+
+# Tables indexed by bitboard: whether it holds a line, its cells and its set cells as actions
+_WINS = [any(board & line == line for line in _LINES) for board in range(_FULL + 1)]
+_WIN_TABLE = np.array(_WINS)
+_CELLS = (np.arange(_FULL + 1)[:, None] >> np.arange(9)) & 1
+_MASKS = _CELLS.astype(bool)
+_MASKS.flags.writeable = False
+_ACTIONS = [np.flatnonzero(cells).tolist() for cells in _CELLS]
+
+# The 8 symmetries of the board, as the image of each cell (and so of each action)
+_SYMMETRIES = np.array(
+    [
+        [3 * r + c for r, c in (f(i // 3, i % 3) for i in range(9))]
+        for f in dihedral_maps(2)
+    ]
+)
+_SYMMETRY_INDICES = gather_indices(_SYMMETRIES)
+
+# Tables indexed by bitboard: the bitboard transformed by each symmetry
+_SYMMETRY_BOARDS = (_CELLS @ (1 << _SYMMETRIES).T).T.tolist()
 
 
 class TicTacToe:
-    """A toy tictactoe environment for testing MCTS"""
+    """A toy tictactoe environment for testing MCTS
+
+    The board is kept as one bitboard per player, so steps, win checks and the
+    valid actions are table lookups. The `state` array is only built when it is read."""
+
+    # `step` and `push` accept observe=False to skip the observation
+    lazy_observations = True
 
     def __init__(self):
         self.action_space = 9
@@ -12,77 +46,228 @@ class TicTacToe:
 
     @property
     def actions(self):
-        actions = []
-        for i in range(self._state.size):
-            if self._state[i] == 0:
-                actions.append(i)
-        return actions
+        return _ACTIONS[self._free][:]
+
+    @property
+    def action_mask(self):
+        """A read-only boolean array of size `action_space` that is True for valid actions."""
+        return _MASKS[self._free]
 
     @property
     def state(self):
-        layer1 = (self._state == 0).astype(int).reshape([3, 3])
-        layer2 = (self._state == 1).astype(int).reshape([3, 3])
-        layer3 = (self._state == -1).astype(int).reshape([3, 3])
-        return np.stack([layer1, layer2, layer3])
+        if self._observation is None:
+            # Layers of empty cells, player 1 pieces and player 2 pieces
+            x, o = self._boards
+            self._observation = _CELLS[[self._free, x, o]].reshape([3, 3, 3])
+        return self._observation
 
-    def step(self, action):
-        assert action in self.actions, {"Invalid Action: {}".format(action)}
+    @property
+    def hash_key(self):
+        """A key that uniquely identifies the position: both bitboards side by side."""
+        x, o = self._boards
+        return x | o << 9
 
-        if self.player == 1:
-            self._state[action] = 1
-        else:
-            self._state[action] = -1
+    @property
+    def _free(self):
+        x, o = self._boards
+        return _FULL ^ (x | o)
 
-        win = self._check_win()
+    def step(self, action, observe=True):
+        """Takes an action.
 
-        if win:
+        Returns the observation, reward and done flag, or only the reward and done
+        flag if `observe` is False."""
+        bit = 1 << int(action)
+        assert self._free & bit, "Invalid Action: {}".format(action)
+
+        board = self._boards[self.player - 1] | bit
+        self._boards[self.player - 1] = board
+        self._observation = None
+
+        if _WINS[board]:
             self.terminal = True
             self.winner = self.player
-            return self.state, 1, True
-        elif self._board_full():
+            reward, done = 1, True
+        elif not self._free:
             self.terminal = True
-            return self.state, 0, True
+            reward, done = 0, True
         else:
             self._rotate_players()
-            return self.state, 0, False
+            reward, done = 0, False
+
+        if observe:
+            return self.state, reward, done
+        return reward, done
+
+    @property
+    def symmetries(self):
+        """The action permutation of each symmetry of the board, starting with the identity."""
+        return _SYMMETRIES
+
+    def transform_state(self, state, symmetry):
+        """Returns `state` transformed by the symmetry with index `symmetry`."""
+        return state.reshape([3, 9])[:, _SYMMETRY_INDICES[symmetry]].reshape([3, 3, 3])
+
+    def canonical_key(self):
+        """Returns the smallest `hash_key` among the symmetric variants of the position, and the
+        index of the symmetry that gives it. The bitboards are transformed by table lookups."""
+        x, o = self._boards
+        return min(
+            (boards[x] | boards[o] << 9, symmetry)
+            for symmetry, boards in enumerate(_SYMMETRY_BOARDS)
+        )
+
+    def random_playouts(self, count):
+        """Plays `count` games of random moves to the end at once, without changing the environment.
+
+        The move order of each game is a random permutation of the free cells, drawn up
+        front. The games are then played together, one move of every game per step.
+
+        Arguments:
+            count {int} -- The number of games
+
+        Returns:
+            numpy.array -- The winner of each game, or 0 for a draw
+        """
+        if self.terminal:
+            return np.full(count, self.winner or 0)
+
+        free = self._free
+        keys = np.random.random_sample((count, 9))
+        keys[:, ~_MASKS[free]] = 2
+        moves = 1 << np.argsort(keys, axis=1)[:, : len(_ACTIONS[free])]
+
+        boards = np.array([self._boards] * count)
+        winners = np.zeros(count, dtype=int)
+        playing = np.ones(count, dtype=bool)
+        for turn in range(moves.shape[1]):
+            mover = (self.player - 1 + turn) % 2
+            # Finished games add no more pieces
+            boards[:, mover] |= moves[:, turn] * playing
+            won = playing & _WIN_TABLE[boards[:, mover]]
+            winners[won] = mover + 1
+            playing &= ~won
+
+        return winners
+
+    def push(self, action, observe=True):
+        """Takes a step that can be undone with `pop`."""
+        self._undo.append((action, self.player, self.terminal, self.winner))
+        return self.step(action, observe)
+
+    def pop(self):
+        """Undoes the last step taken with `push`."""
+        action, self.player, self.terminal, self.winner = self._undo.pop()
+        self._boards[self.player - 1] ^= 1 << int(action)
+        self._observation = None
+
+    @property
+    def pushes(self):
+        """The number of steps that can be undone with `pop`."""
+        return len(self._undo)
 
     def reset(self):
-        self._state = np.zeros(9)
+        self._boards = [0, 0]
+        self._observation = None
         self.winner = None
         self.player = 1
         self.terminal = False
+        self._undo = []
 
     def board(self):
-        return self._state.reshape([3, 3])
-
-    def _check_win(self):
-        # Check rows
-        state = self._state.reshape([3, 3])
-        for row in state:
-            if sum(row) == 3 or sum(row) == -3:
-                return True
-
-        for column in state.T:
-            if sum(column) == 3 or sum(column) == -3:
-                return True
-
-        # Check diagonal
-        if sum(state.diagonal()) == 3 or sum(state.diagonal()) == -3:
-            return True
-
-        if (
-            np.fliplr(state).diagonal().sum() == 3
-            or np.fliplr(state).diagonal().sum() == -3
-        ):
-            return True
-        else:
-            return False
-
-    def _board_full(self):
-        return not 0 in self._state
+        x, o = self._boards
+        return (_CELLS[x] - _CELLS[o]).reshape([3, 3]).astype(float)
 
     def _rotate_players(self):
         self.player = 1 if self.player == 2 else 2
 
+    def vectorized(self, n):
+        """Returns a `VecTicTacToe` of `n` new games."""
+        return VecTicTacToe(n)
+
     def clone(self):
-        return deepcopy(self)
+        # Everything but the bitboards and the undo stack is immutable
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        clone._boards = self._boards[:]
+        clone._undo = self._undo[:]
+        return clone
+
+
+class VecTicTacToe:
+    """N tictactoe games held in stacked arrays and stepped together.
+
+    Each game is a row of the bitboard array. `player`, `terminal` and `winner` hold
+    the values of every game, with a winner of 0 for games without one."""
+
+    def __init__(self, n):
+        self.n_envs = n
+        self.action_space = 9
+        self.n_players = 2
+        self.reset()
+
+    @property
+    def action_mask(self):
+        """A boolean array of shape (n, action_space) that is True for the valid actions of each game."""
+        return _MASKS[self._free]
+
+    @property
+    def state(self):
+        """The states of all games, stacked in an array of shape (n, 3, 3, 3)."""
+        x, o = self._boards.T
+        return _CELLS[np.stack([self._free, x, o], axis=1)].reshape([-1, 3, 3, 3])
+
+    @property
+    def _free(self):
+        return _FULL ^ (self._boards[:, 0] | self._boards[:, 1])
+
+    def step(self, actions, observe=True):
+        """Takes an action in every game that has not ended. The actions of other games are ignored.
+
+        Returns the observations, rewards and done flags of all games, or only the
+        rewards and done flags if `observe` is False."""
+        actions = np.asarray(actions)
+        games = np.flatnonzero(~self.terminal)
+        bits = 1 << actions[games]
+        if not (self._free[games] & bits).all():
+            raise ValueError("Invalid Actions: {}".format(actions))
+
+        movers = self.player[games] - 1
+        boards = self._boards[games, movers] | bits
+        self._boards[games, movers] = boards
+
+        won = _WIN_TABLE[boards]
+        done = won | (self._free[games] == 0)
+        self.winner[games[won]] = self.player[games[won]]
+        self.terminal[games] = done
+        playing = games[~done]
+        self.player[playing] = 3 - self.player[playing]
+
+        rewards = np.zeros(self.n_envs, dtype=int)
+        rewards[games[won]] = 1
+        if observe:
+            return self.state, rewards, self.terminal.copy()
+        return rewards, self.terminal.copy()
+
+    def reset(self, indices=None):
+        """Starts new games, in place of the games at `indices` or of all games."""
+        if indices is None:
+            self._boards = np.zeros([self.n_envs, 2], dtype=np.int64)
+            self.player = np.ones(self.n_envs, dtype=int)
+            self.terminal = np.zeros(self.n_envs, dtype=bool)
+            self.winner = np.zeros(self.n_envs, dtype=int)
+            return
+
+        self._boards[indices] = 0
+        self.player[indices] = 1
+        self.terminal[indices] = False
+        self.winner[indices] = 0
+
+    def environment(self, index):
+        """Returns a `TicTacToe` in the position of the game at `index`."""
+        environment = TicTacToe()
+        environment._boards = self._boards[index].tolist()
+        environment.player = int(self.player[index])
+        environment.terminal = bool(self.terminal[index])
+        environment.winner = int(self.winner[index]) or None
+        return environment
@@ -2,19 +2,82 @@ import xxhash
 import logwood
 import numpy as np
 import datetime
+import math
+import time
+import threading
+import inspect
+from contextlib import contextmanager, nullcontext
 from sortedcontainers.sorteddict import SortedDict
 from copy import deepcopy
 from .tree.gametree import GameTree
+from .tree.arraytree import ArrayGameTree
 from . import SUPPORTED_POLICY_TYPES
 from .builder import ConfigBuilder
-from multiprocessing import Process
+from .stats import SearchStats, PHASES
+import multiprocessing
+
+
+class _Descent:
+    """The state of a single search between its selection and update phases"""
+
+    __slots__ = (
+        "environment",
+        "history",
+        "path",
+        "current",
+        "reward",
+        "done",
+        "depth",
+        "selected",
+        "expanding",
+        "in_place",
+        "pushes",
+        "symmetry",
+        "collided",
+    )
+
+    def __init__(self, environment, root, in_place=False, symmetry=None):
+        self.environment = environment
+        # Maps the environment's actions to those of the current node
+        self.symmetry = symmetry
+        self.in_place = in_place
+        # An in-place search is unwound by popping back to this many pushes
+        self.pushes = environment.pushes if in_place else 0
+        self.history = []
+        self.path = [root.id]
+        self.current = root
+        self.reward = 0
+        self.done = False
+        self.depth = 0
+        self.selected = 0
+        self.expanding = False
+        # Whether the leaf was being expanded by another search
+        self.collided = False
 
 
 class MCTS:
+
+    _TREE_LOOKUP = {"dict": GameTree, "array": ArrayGameTree}
+
     def __init__(
-        self, environment, calculation_time=5, terminal_callback=None, name=None
+        self,
+        environment,
+        calculation_time=5,
+        terminal_callback=None,
+        name=None,
+        tree="dict",
+        tree_kwargs=None,
+        clock_check_interval=8,
+        workers=1,
+        threads=1,
+        virtual_loss=1,
+        instrument=False,
     ):
-        self.tree = GameTree()
+        if tree not in self._TREE_LOOKUP:
+            raise ValueError("{} is not a supported tree type.".format(tree))
+        self.tree = self._TREE_LOOKUP[tree](**(tree_kwargs or {}))
+        self._tree_type = tree
+        self._tree_kwargs = tree_kwargs
 
         # Configure logger
         if name == None:
@@ -23,6 +86,42 @@ class MCTS:
         self._logger = logwood.get_logger(name)
         self.environment = environment
         self.calculation_time = calculation_time
+        self.clock_check_interval = clock_check_interval
+        self.last_search = None
+
+        # Phase timing and depth histograms are only collected when instrumented
+        self.instrument = instrument
+        self._phase_times = dict.fromkeys(PHASES, 0.0)
+        self._hooks = []
+
+        # Root-parallel search runs in a pool of worker processes
+        self.workers = workers
+        self._pool = None
+
+        # Tree-parallel search runs several threads over this tree. Edges on
+        # in-flight paths carry a virtual loss so that the threads diverge.
+        self.threads = threads
+        self.virtual_loss = virtual_loss
+        self._virtual_loss = 0
+        self._lock = threading.Lock() if threads > 1 else nullcontext()
+        self._expanding = set()
+        # Notified whenever a pending expansion finishes
+        self._expanded = threading.Condition(self._lock) if threads > 1 else None
+
+        # Pondering searches from a snapshot of the environment in a background
+        # thread until it is stopped
+        self.last_ponder = None
+        self._stop = threading.Event()
+        self._ponder_thread = None
+        self._ponder_error = None
+        self._search_environment = None
+
+        # Each searching thread steps its own copy of the environment in place
+        # when the environment supports push/pop
+        self._local = threading.local()
+
+        # Inverse action permutations of the environment's symmetries
+        self._inverse_symmetries = (None, None)
         if terminal_callback:
             self._handle_terminal = terminal_callback
             self._handle_terminal.add_tree(self.tree)
@@ -33,8 +132,10 @@ class MCTS:
         self.reset()
 
     def build(self, raw_config):
+        self._raw_config = raw_config
         config = self._builder.build(raw_config)
         self.policies = config.values()
+        self.early_stop = None
         for key, policy in config.items():
             if key not in SUPPORTED_POLICY_TYPES:
                 raise ValueError("{} is not a supported policy type.".format(key))
@@ -52,6 +153,8 @@ class MCTS:
                 self.update.add_tree(self.tree)
             elif key == "expansion_rollout":
                 self.expansion_rollout = policy
+            elif key == "early_stop":
+                self.early_stop = policy
 
         # Check that required policies exist
         if not self.update or not self.select or not self.expand:
@@ -59,6 +162,35 @@ class MCTS:
                 "Config dictionary is missing vital policies. selection, expansion and update policies are required."
             )
 
+        # Expansion policies may evaluate several leaves at once
+        self.batch_size = getattr(self.expand, "batch_size", 1)
+
+        # Expansion policies with progressive widening add edges during selection
+        self._widen = getattr(self.expand, "widen", None)
+
+        # Update policies may also learn from the moves of the simulation
+        self._record_rollout = getattr(self.update, "records_rollout", False)
+        if self._record_rollout and self.tree.symmetries:
+            raise ValueError(
+                "Update policies that record the simulation do not support tree symmetries."
+            )
+
+        # Simulation policies may play several games and return their averaged outcome
+        self._playout_outcome = getattr(
+            getattr(self, "simulate", None), "returns_outcome", False
+        )
+        if self._playout_outcome and (
+            self._record_rollout
+            or "outcome" not in inspect.signature(self.update).parameters
+        ):
+            raise ValueError(
+                "{} does not support simulation outcomes.".format(
+                    type(self.update).__name__
+                )
+            )
+        if self.threads > 1 or self.batch_size > 1:
+            self._virtual_loss = self.virtual_loss
+
         self.configured = True
 
     @property
@@ -70,42 +202,384 @@ class MCTS:
         self._calculation_time = datetime.timedelta(seconds=seconds)
 
     def reset(self):
+        self.stop_pondering()
         self.terminal = False
         self.game_history = []
         self.tree.reset()
+        self._expanding.clear()
+
+    def act(self, simulations=None, nodes=None, calculation_time=None, deadline=None):
+        """Searches from the current environment state and takes the chosen action.
+
+        The search budget can be given as a number of simulations, a number of new
+        nodes, a calculation time in seconds and/or a `time.monotonic()` deadline.
+        The search stops as soon as any of the given budgets is spent. If no budget
+        is given, the search runs for `calculation_time`. The statistics of the search
+        are kept in `last_search`.
 
-    def act(self):
+        If `workers` is greater than one, each worker process searches its own tree
+        with the full budget, and the root statistics are summed before the action
+        policy chooses. If `threads` is greater than one, the threads search this
+        tree together.
+
+        If the MCTS is pondering, pondering is stopped first.
+
+        Returns:
+            tuple -- The game history, reward, done flag and winner
+        """
         assert self.configured, "MCTS must be configured before running."
 
-        state = self.environment.state
-        player = self.environment.player
+        # The statistics gathered while pondering are kept in the tree
+        self.stop_pondering()
 
-        current = self.tree.get_by_state(state, player=player)
-        self.game_history.append(current.id)
+        current, symmetry = self._start_move()
 
         if self.terminal:
             raise ValueError("Game environment is terminal. Cannot take action.")
-        begin = datetime.datetime.utcnow()
-
-        # Information to collect while running search
-        games_played = 0
-        max_depth = 0
 
-        # Run MCTS for the calculation window
-        while datetime.datetime.utcnow() - begin < self._calculation_time:
-            self.run(current)
-            # max_depth = max(depth, max_depth)
+        if self.workers > 1:
+            search = self.search_root_parallel
+        elif self.threads > 1:
+            search = self.search_tree_parallel
+        else:
+            search = self.search
 
+        self.last_search = search(
+            current,
+            simulations=simulations,
+            nodes=nodes,
+            calculation_time=calculation_time,
+            deadline=deadline,
+        )
         self._logger.debug(
-            "Searches Run: {} | Max Depth: {}".format(games_played, max_depth)
+            "Searches Run: {} | Sims/s: {:.0f} | Max Depth: {} | Tree Size: {}".format(
+                self.last_search.simulations,
+                self.last_search.simulations_per_second,
+                self.last_search.max_depth,
+                self.last_search.tree_size,
+            )
         )
 
         # Act in the environment
         action = self.choose(current)
-        current, reward, done = self._step(current, action, self.environment)
+        current, reward, done, _ = self._step(
+            current, action, self.environment, symmetry=symmetry
+        )
+
+        # Keep the subtree we moved into as the tree for the next search.
+        # Nodes in the game history are kept so their search statistics stay available.
+        self.tree.reroot(current, keep=self.game_history)
 
         return self.game_history, reward, done, self.environment.winner
 
+    def search(
+        self, root, simulations=None, nodes=None, calculation_time=None, deadline=None
+    ):
+        """Runs simulations from `root` until a budget is spent.
+
+        Arguments:
+            root {mcts.tree.Node} -- The root node to search from
+
+        Keyword Arguments:
+            simulations {int} -- Maximum number of simulations to run (default: {None})
+            nodes {int} -- Maximum number of nodes to add to the tree (default: {None})
+            calculation_time {float} -- Maximum search time in seconds (default: {None})
+            deadline {float} -- A `time.monotonic()` time to stop searching at (default: {None})
+
+        Returns:
+            SearchStats -- The statistics of the search
+        """
+        start = self._start_stats()
+        deadline = self._resolve_deadline(
+            start["begin"], simulations, nodes, calculation_time, deadline
+        )
+
+        # The clock is only read every `clock_check_interval` rounds
+        interval = self.clock_check_interval
+        start_nodes = start["nodes"]
+        histogram = {} if self.instrument else None
+        n_rounds = 0
+        n_simulations = 0
+        max_depth = 0
+        total_depth = 0
+        early_stop = self._early_stop_checks()
+
+        with self._scratch_environment():
+            while not self._stop.is_set():
+                if simulations is not None and n_simulations >= simulations:
+                    break
+                if self._stop_early(
+                    root,
+                    early_stop,
+                    start["begin"],
+                    n_simulations,
+                    simulations,
+                    deadline,
+                ):
+                    break
+                if nodes is not None and self.tree.misses - start_nodes >= nodes:
+                    break
+                if (
+                    deadline is not None
+                    and n_rounds % interval == 0
+                    and time.monotonic() >= deadline
+                ):
+                    break
+
+                n_rounds += 1
+
+                for depth in self._run_round(root, simulations, n_simulations):
+                    n_simulations += 1
+                    total_depth += depth
+                    if depth > max_depth:
+                        max_depth = depth
+                    if histogram is not None:
+                        histogram[depth] = histogram.get(depth, 0) + 1
+
+        return self._finish_stats(
+            start,
+            n_simulations,
+            max_depth,
+            total_depth,
+            histogram,
+            early_stop["stopped"],
+        )
+
+    def search_tree_parallel(
+        self, root, simulations=None, nodes=None, calculation_time=None, deadline=None
+    ):
+        """Runs simulations from `root` in `threads` threads that share this tree.
+
+        Tree updates are serialized by a lock, but model evaluations during expansion
+        run outside of it, so several evaluations can be in flight at once. The budget
+        is shared between the threads (see `search`).
+
+        Returns:
+            SearchStats -- The statistics of the search
+        """
+        start = self._start_stats()
+        deadline = self._resolve_deadline(
+            start["begin"], simulations, nodes, calculation_time, deadline
+        )
+
+        start_nodes = start["nodes"]
+        histogram = {} if self.instrument else None
+        counts = {"started": 0, "finished": 0, "max_depth": 0, "total_depth": 0}
+        early_stop = self._early_stop_checks()
+        errors = []
+
+        def work():
+            try:
+                with self._scratch_environment():
+                    while not self._stop.is_set():
+                        with self._lock:
+                            started = counts["started"]
+                            if simulations is not None and started >= simulations:
+                                return
+                            if (
+                                nodes is not None
+                                and self.tree.misses - start_nodes >= nodes
+                            ):
+                                return
+                            if early_stop["stopped"]:
+                                return
+                            counts["started"] += self.batch_size
+
+                        # Simulations are slow enough here to read the clock each time
+                        if deadline is not None and time.monotonic() >= deadline:
+                            return
+
+                        depths = self._run_round(root, simulations, started)
+                        with self._lock:
+                            # Give back the budget of searches that collided
+                            counts["started"] -= self.batch_size - len(depths)
+                            counts["finished"] += len(depths)
+                            counts["total_depth"] += sum(depths)
+                            counts["max_depth"] = max([counts["max_depth"]] + depths)
+                            if histogram is not None:
+                                for depth in depths:
+                                    histogram[depth] = (
+                                        histogram.get(depth, 0) + 1
+                                    )
+
+                            self._stop_early(
+                                root,
+                                early_stop,
+                                start["begin"],
+                                counts["finished"],
+                                simulations,
+                                deadline,
+                            )
+            except Exception as e:
+                # A failed search has already released its leaves to the other threads
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+        return self._finish_stats(
+            start,
+            counts["finished"],
+            counts["max_depth"],
+            counts["total_depth"],
+            histogram,
+            early_stop["stopped"],
+        )
+
+    def search_root_parallel(
+        self, root, simulations=None, nodes=None, calculation_time=None, deadline=None
+    ):
+        """Searches independent trees in `workers` processes and merges their roots.
+
+        Every worker searches a new tree from a copy of the environment with the given
+        budget (see `search`). The visit counts and values of the root edges of all workers
+        are then added to the edges of `root`.
+
+        The configuration passed to `build` is used to build the MCTS in each worker,
+        so root-parallel search is meant for configurations without a neural network.
+
+        Returns:
+            SearchStats -- The combined statistics of all workers
+        """
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(
+                self.workers,
+                initializer=_init_worker,
+                initargs=(
+                    self._raw_config,
+                    self._tree_type,
+                    self._tree_kwargs,
+                    self.clock_check_interval,
+                    self.instrument,
+                    multiprocessing.Barrier(self.workers),
+                ),
+            )
+
+        budget = {
+            "simulations": simulations,
+            "nodes": nodes,
+            "calculation_time": calculation_time,
+            "deadline": deadline,
+        }
+        if all(value is None for value in budget.values()):
+            budget["calculation_time"] = self._calculation_time.total_seconds()
+
+        # Seeds are drawn from the parent so that fixed budgets are reproducible
+        seeds = np.random.randint(2 ** 31 - 1, size=self.workers)
+        tasks = [(self.environment, budget, seed) for seed in seeds]
+
+        begin = time.monotonic()
+        results = self._pool.map(_search_worker, tasks, chunksize=1)
+
+        if not root.expanded:
+            _, symmetry = self._lookup(self.environment)
+            actions = self._node_actions(
+                self.environment, self._valid_actions(self.environment), symmetry
+            )
+            self.expand(root, actions)
+
+        # The workers may have widened the root differently
+        if self._widen is not None:
+            self._widen(root, width=len(self.environment.actions))
+
+        for actions, n, w, _ in results:
+            for action, edge_n, edge_w in zip(actions, n, w):
+                edge = root[action]
+                edge.n += edge_n
+                edge.w += edge_w
+
+        stats = SearchStats.combine(
+            [result for _, _, _, result in results], time.monotonic() - begin
+        )
+        for hook in self._hooks:
+            hook(stats)
+        return stats
+
+    def ponder(self, simulations=None, nodes=None):
+        """Starts searching from the current position in a background thread.
+
+        Call this after `act`, while the opponent is thinking. The search runs on a
+        snapshot of the environment, so the opponent may step the environment in the
+        meantime. It runs until `stop_pondering` is called or until the optional budget
+        is spent. The next call to `act` stops pondering and searches on from the
+        subtree of the move the opponent made, keeping its statistics.
+
+        Keyword Arguments:
+            simulations {int} -- Maximum number of simulations to run (default: {None})
+            nodes {int} -- Maximum number of nodes to add to the tree (default: {None})
+        """
+        assert self.configured, "MCTS must be configured before running."
+        if self._ponder_thread is not None or getattr(
+            self.environment, "terminal", False
+        ):
+            return
+
+        environment = self.environment.clone()
+        root, _ = self._lookup(environment)
+        search = self.search_tree_parallel if self.threads > 1 else self.search
+
+        def work():
+            try:
+                self.last_ponder = search(
+                    root, simulations=simulations, nodes=nodes, deadline=math.inf
+                )
+            except Exception as e:
+                self._ponder_error = e
+
+        self._search_environment = environment
+        self._stop.clear()
+        self._ponder_thread = threading.Thread(target=work, daemon=True)
+        self._ponder_thread.start()
+
+    def stop_pondering(self):
+        """Stops the pondering search and waits for it to finish.
+
+        Returns:
+            SearchStats -- The statistics of the pondering search, or None if the
+                MCTS was not pondering
+        """
+        if self._ponder_thread is None:
+            return None
+
+        self._stop.set()
+        self._ponder_thread.join()
+        self._ponder_thread = None
+        self._search_environment = None
+        self._stop.clear()
+
+        if self._ponder_error is not None:
+            error, self._ponder_error = self._ponder_error, None
+            raise error
+
+        self._logger.debug(
+            "Pondered: {} searches".format(self.last_ponder.simulations)
+        )
+        return self.last_ponder
+
+    def add_hook(self, hook):
+        """Adds a hook that is called with the SearchStats of every search.
+
+        Hooks can be used to export search statistics to a metrics pipeline.
+
+        Arguments:
+            hook {callable} -- Called as hook(stats) when a search finishes
+        """
+        self._hooks.append(hook)
+
+    def close(self):
+        """Stops pondering and shuts down the worker processes used for root-parallel search."""
+        self.stop_pondering()
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
     def run(self, root):
         """Runs a single MCTS search based on policies provided during `build`.
         
@@ -113,50 +587,69 @@ class MCTS:
             root {mcts.tree.Node} -- The root node to run from
         
         Returns:
-            depth -- The depth reached up until the first leaf node
+            depth -- The depth reached up until the first leaf node, or None if the leaf
+                was being expanded by another search
         """
         assert self.configured, "MCTS must be configured before running."
 
-        env_clone = self.environment.clone()
-        history = []
-        current = root
-        done = False
-        depth = 0
-        reward = 0
+        descent = self._descend(root)
+
+        # Expansion Phase
+        if descent.expanding:
+            if self.instrument:
+                begin = time.perf_counter()
+            try:
+                self._expand(descent.current, self._leaf_actions(descent))
+            except Exception:
+                self._abandon(descent)
+                raise
+            if self.instrument:
+                self._add_phase_time("expansion", begin)
 
-        # Selection Phase: Use selection policy to traverse
-        # game tree until a leaf node (unexpanded) is reached.
-        while not done and current.expanded:
-            action = self.select(current)
-            history.append([current.id, action])
-            current, reward, done = self._step(current, action, env_clone)
+        return self._complete(descent)
 
-            depth += 1
+    def run_batch(self, root, k):
+        """Runs `k` MCTS searches whose leaves are evaluated together.
 
-        # Expansion Phase
-        if not done:
-            self.expand(current, env_clone.actions)
-            depth += 1
+        All `k` selection phases run first, with virtual loss on the selected edges
+        so that they reach different leaves. The leaves are then expanded with a
+        single batched call to the expansion policy before each search completes.
+
+        Arguments:
+            root {mcts.tree.Node} -- The root node to run from
+            k {int} -- The number of searches
+
+        Returns:
+            list -- The depth reached by each search, or None for searches whose leaf was
+                being expanded by another search
+        """
+        assert self.configured, "MCTS must be configured before running."
 
-            # Perform another rollout if applicable
+        # The descents are in flight together, so each needs its own environment
+        descents = [self._descend(root, in_place=False) for _ in range(k)]
+
+        # Expansion Phase
+        expanding = [descent for descent in descents if descent.expanding]
+        if expanding:
+            if self.instrument:
+                begin = time.perf_counter()
             try:
-                action = self.expansion_rollout(current, env_clone)
-                history.append([current.id, action])
-                current, reward, done = self._step(current, action, env_clone)
-                depth += 1
+                evaluations = self.expand.evaluate_batch(
+                    [descent.current for descent in expanding]
+                )
+                with self._lock:
+                    for descent, evaluation in zip(expanding, evaluations):
+                        self.expand.apply(
+                            descent.current, self._leaf_actions(descent), evaluation
+                        )
             except Exception:
-                self._logger.debug("No Expansion Rollout Phase")
-
-        # Simulation Phase if Applicable
-        try:
-            if not done:
-                _, reward, done = self.simulate(current, env_clone)
-        except Exception:
-            self._logger.debug("No simulation phase")
+                for descent in descents:
+                    self._abandon(descent)
+                raise
+            if self.instrument:
+                self._add_phase_time("expansion", begin)
 
-        # Update Phase
-        self.update(env_clone, reward, history)
-        return depth
+        return [self._complete(descent) for descent in descents]
 
     def set_policy_attribute(self, policy_tuple):
         """Updates an attribute on all policies that have it.
@@ -169,10 +662,470 @@ class MCTS:
             if hasattr(policy, name):
                 setattr(policy, name, value)
 
-    def _step(self, current, action, environment):
-        """Takes a step in the environment"""
-        observation, reward, done = environment.step(action)
+    def _descend(self, root, in_place=True):
+        """Runs the selection phase of a search from `root`.
+
+        Inside a search, environments with the push/pop protocol are stepped in
+        place and unwound when the search completes. Otherwise, the search steps
+        a clone of the environment.
+
+        Returns:
+            _Descent -- The state of the search at the leaf that was reached
+        """
+        if self.instrument:
+            begin = time.perf_counter()
+
+        scratch = getattr(self._local, "environment", None)
+        if in_place and scratch is not None:
+            descent = _Descent(scratch, root, in_place=True)
+        else:
+            environment = self._search_environment
+            if environment is None:
+                environment = self.environment
+            descent = _Descent(environment.clone(), root)
+        if self.tree.symmetries:
+            descent.symmetry = self.tree.node_key(descent.environment, None)[2]
+        history = descent.history
+        path = descent.path
+        env_clone = descent.environment
+        current = root
+        done = False
+
+        with self._lock:
+            # Nodes on the path must survive evictions until the update is done
+            self.tree.pin(root.id)
+
+            # Selection Phase: Use selection policy to traverse
+            # game tree until a leaf node (unexpanded) is reached.
+            # Nodes being expanded by another search count as leaves.
+            while not done:
+                if current.id in self._expanding and self._can_wait():
+                    self._expanded.wait_for(lambda: current.id not in self._expanding)
+                if not current.expanded or current.id in self._expanding:
+                    break
+
+                if self._widen is not None:
+                    self._widen(current)
+                action = self.select(current)
+                history.append([current.id, action])
+                self._add_virtual_loss(current, action, self._virtual_loss)
+                current, descent.reward, done, descent.symmetry = self._step(
+                    current, action, env_clone, descent.in_place, descent.symmetry
+                )
+                path.append(current.id)
+                self.tree.pin(current.id)
+
+                descent.depth += 1
+
+            descent.current = current
+            descent.done = done
+            descent.selected = len(history)
+            descent.expanding = (
+                not done
+                and not current.expanded
+                and current.id not in self._expanding
+            )
+            descent.collided = not done and not descent.expanding
+            if descent.expanding:
+                self._expanding.add(current.id)
+                self._local.pending = getattr(self._local, "pending", 0) + 1
+
+        if self.instrument:
+            self._add_phase_time("selection", begin)
+        return descent
+
+    def _complete(self, descent):
+        """Runs the phases of a search that follow the expansion of its leaf.
+
+        A search whose leaf was being expanded by another search is only unwound.
+
+        Returns:
+            depth -- The depth reached up until the first leaf node, or None if the search collided
+        """
+        if descent.collided:
+            self._abandon(descent)
+            return None
+
+        env_clone = descent.environment
+        history = descent.history
+        current = descent.current
+        reward = descent.reward
+        done = descent.done
+        if self.instrument:
+            begin = time.perf_counter()
+
+        if descent.expanding:
+            descent.depth += 1
+
+            with self._lock:
+                self._release_expansion(current.id)
+
+                # Perform another rollout if applicable
+                try:
+                    action = self.expansion_rollout(current, env_clone)
+                    history.append([current.id, action])
+                    current, reward, done, descent.symmetry = self._step(
+                        current, action, env_clone, descent.in_place, descent.symmetry
+                    )
+                    descent.path.append(current.id)
+                    self.tree.pin(current.id)
+                    descent.depth += 1
+                except Exception:
+                    self._logger.debug("No Expansion Rollout Phase")
+
+            if self.instrument:
+                begin = self._add_phase_time("expansion_rollout", begin)
+
+        # Simulation Phase if Applicable
+        moves = [] if self._record_rollout else None
+        outcome = None
+        try:
+            if not done:
+                if self._playout_outcome:
+                    _, reward, done, outcome = self.simulate(current, env_clone)
+                elif moves is None:
+                    _, reward, done = self.simulate(current, env_clone)
+                else:
+                    _, reward, done = self.simulate(current, env_clone, moves=moves)
+        except Exception:
+            self._logger.debug("No simulation phase")
+
+        if self.instrument:
+            begin = self._add_phase_time("simulation", begin)
+
+        # Update Phase
+        with self._lock:
+            if self._virtual_loss:
+                for node_id, action in history[: descent.selected]:
+                    node = self.tree.get_by_id(node_id)
+                    self._add_virtual_loss(node, action, -self._virtual_loss)
+            if moves is not None:
+                self.update(env_clone, reward, history, moves=moves)
+            elif outcome is not None:
+                self.update(env_clone, reward, history, outcome=outcome)
+            else:
+                self.update(env_clone, reward, history)
+
+            for node_id in descent.path:
+                self.tree.unpin(node_id)
+
+        # Unwind the search, including the steps of the simulation
+        if descent.in_place:
+            while env_clone.pushes > descent.pushes:
+                env_clone.pop()
+
+        if self.instrument:
+            self._add_phase_time("update", begin)
+        return descent.depth
+
+    def _release_expansion(self, node_id):
+        """Marks the expansion of a node by the calling thread as finished. Call it holding the lock."""
+        self._expanding.discard(node_id)
+        self._local.pending -= 1
+        if self._expanded is not None:
+            self._expanded.notify_all()
+
+    def _can_wait(self):
+        """Returns whether the calling thread may wait for an expansion by another thread.
+
+        A thread that has leaves of its own pending expansion does not wait, since the
+        owner of the awaited leaf could in turn be waiting for one of them."""
+        return self._expanded is not None and not getattr(self._local, "pending", 0)
+
+    def _abandon(self, descent):
+        """Unwinds a search without simulating or updating, releasing its virtual loss and pins.
+
+        If the search claimed its leaf for expansion, the claim is released too."""
+        with self._lock:
+            if descent.expanding:
+                self._release_expansion(descent.current.id)
+                descent.expanding = False
+
+            if self._virtual_loss:
+                for node_id, action in descent.history[: descent.selected]:
+                    node = self.tree.get_by_id(node_id)
+                    self._add_virtual_loss(node, action, -self._virtual_loss)
+
+            for node_id in descent.path:
+                self.tree.unpin(node_id)
+
+        if descent.in_place:
+            while descent.environment.pushes > descent.pushes:
+                descent.environment.pop()
+
+    @contextmanager
+    def _scratch_environment(self):
+        """Gives the calling thread a copy of the environment to search in place.
+
+        Only environments that implement `push`, `pop` and `pushes` are searched
+        in place."""
+        environment = self._search_environment
+        if environment is None:
+            environment = self.environment
+
+        if not hasattr(environment, "push"):
+            yield
+            return
+
+        self._local.environment = environment.clone()
+        try:
+            yield
+        finally:
+            self._local.environment = None
+
+    def _add_phase_time(self, phase, begin):
+        """Adds the time since `begin` to a phase and returns the current time.
+
+        Call it without holding the lock. Search threads add to the same totals."""
+        now = time.perf_counter()
+        with self._lock:
+            self._phase_times[phase] += now - begin
+        return now
+
+    def _start_stats(self):
+        """Records the counters that the statistics of a search are measured from."""
+        self._phase_times = dict.fromkeys(PHASES, 0.0)
+        return {
+            "begin": time.monotonic(),
+            "nodes": self.tree.misses,
+            "hits": self.tree.hits,
+            "transpositions": self.tree.transpositions,
+            "nn_calls": getattr(self.expand, "calls", 0),
+            "nn_latency": getattr(self.expand, "latency", 0),
+        }
+
+    def _finish_stats(
+        self, start, simulations, max_depth, total_depth, histogram, stopped_early
+    ):
+        """Builds the statistics of a search and passes them to the hooks."""
+        stats = SearchStats(
+            simulations=simulations,
+            nodes=self.tree.misses - start["nodes"],
+            max_depth=max_depth,
+            mean_depth=total_depth / max(simulations, 1),
+            elapsed=time.monotonic() - start["begin"],
+            tree_size=len(self.tree),
+            tree_hits=self.tree.hits - start["hits"],
+            transpositions=self.tree.transpositions - start["transpositions"],
+            nn_calls=getattr(self.expand, "calls", 0) - start["nn_calls"],
+            nn_latency=getattr(self.expand, "latency", 0) - start["nn_latency"],
+            phase_times=self._phase_times if self.instrument else None,
+            depth_histogram=histogram,
+            stopped_early=stopped_early,
+        )
+
+        for hook in self._hooks:
+            hook(stats)
+        return stats
+
+    def _resolve_deadline(self, begin, simulations, nodes, calculation_time, deadline):
+        """Returns the deadline of a search that starts at `begin`.
+
+        If no budget is given at all, the search runs for `calculation_time`."""
+        if simulations is None and nodes is None and deadline is None:
+            if calculation_time is None:
+                calculation_time = self._calculation_time.total_seconds()
+
+        if calculation_time is not None:
+            end = begin + calculation_time
+            deadline = end if deadline is None else min(deadline, end)
+
+        return deadline
+
+    def _early_stop_checks(self):
+        """Returns the state of the early stopping checks for a new search."""
+        interval = self.early_stop.check_interval if self.early_stop else None
+        return {"next": interval, "stopped": False}
+
+    def _stop_early(self, root, checks, begin, done, simulations, deadline):
+        """Asks the early stopping policy whether to stop after `done` simulations.
+
+        The policy is consulted every `check_interval` simulations. Once it decides
+        to stop, `checks["stopped"]` is set."""
+        if checks["next"] is None or done < checks["next"]:
+            return checks["stopped"]
+
+        checks["next"] = done + self.early_stop.check_interval
+        remaining = self._remaining_simulations(begin, done, simulations, deadline)
+        checks["stopped"] = bool(self.early_stop(root, remaining))
+        return checks["stopped"]
+
+    def _remaining_simulations(self, begin, done, simulations, deadline):
+        """Estimates how many more simulations a search that started at `begin` can run.
+
+        Time budgets are converted to simulations at the rate of the search so far."""
+        remaining = math.inf
+        if simulations is not None:
+            remaining = simulations - done
+
+        if deadline is not None and done:
+            now = time.monotonic()
+            rate = done / max(now - begin, 1e-9)
+            remaining = min(remaining, rate * (deadline - now))
+
+        return remaining
+
+    def _run_round(self, root, simulations, started):
+        """Runs one search, or one batch of searches if the expansion policy batches.
+
+        Searches that collided with the expansion of another are not counted.
+
+        Returns:
+            list -- The depth reached by each search
+        """
+        if self.batch_size == 1:
+            depths = [self.run(root)]
+        else:
+            k = self.batch_size
+            if simulations is not None:
+                k = min(k, simulations - started)
+            depths = self.run_batch(root, k)
+
+        return [depth for depth in depths if depth is not None]
+
+    def _expand(self, node, actions):
+        """Expands a node, evaluating it outside of the tree lock when the policy allows."""
+        if hasattr(self.expand, "evaluate"):
+            evaluation = self.expand.evaluate(node)
+            with self._lock:
+                self.expand.apply(node, actions, evaluation)
+        else:
+            with self._lock:
+                self.expand(node, actions)
+
+    def _add_virtual_loss(self, node, action, loss):
+        """Counts `loss` in-flight visits to an edge as losses"""
+        if loss:
+            edge = node[action]
+            edge.n += loss
+            edge.w -= loss
+
+    def _step(self, current, action, environment, in_place=False, symmetry=None):
+        """Takes a step in the environment, with `push` if it will be unwound.
+
+        `action` is an action of `current`. If the tree uses symmetries, `symmetry` maps
+        the environment's actions to those of `current`.
+
+        Returns:
+            tuple -- The next node, the reward, the done flag and the symmetry of the next node
+        """
+        environment_action = action
+        if symmetry is not None:
+            environment_action = self._environment_action(environment, action, symmetry)
+
+        step = environment.push if in_place else environment.step
+        if getattr(environment, "lazy_observations", False):
+            # The state is only built if the tree needs it
+            observation = None
+            reward, done = step(environment_action, observe=False)
+        else:
+            observation, reward, done = step(environment_action)
         player = environment.player
 
-        next_node = self.tree.evaluate(current.id, action, observation, player=player)
-        return next_node, reward, done
+        observation, key, symmetry = self.tree.node_key(environment, observation)
+        next_node = self.tree.evaluate(
+            current.id, action, observation, player=player, key=key
+        )
+        return next_node, reward, done, symmetry
+
+    def _start_move(self):
+        """Adds the node of the environment's state to the game history as the root of a new move.
+
+        Returns:
+            tuple -- The root node and its symmetry (see `_step`)
+        """
+        current, symmetry = self._lookup(self.environment)
+        self.game_history.append(current.id)
+        self.tree.pin(current.id)
+        self.tree.generation += 1
+
+        # Release whatever the opponent's move made unreachable
+        current = self.tree.reroot(current, keep=self.game_history)
+        return current, symmetry
+
+    def _lookup(self, environment):
+        """Returns the node of the environment's current state and its symmetry (see `_step`)"""
+        state, key, symmetry = self.tree.node_key(environment, None)
+        node = self.tree.get_by_state(state, player=environment.player, key=key)
+        return node, symmetry
+
+    def _leaf_actions(self, descent):
+        """Returns the valid actions at the leaf of a descent as actions of the leaf node"""
+        environment = descent.environment
+        return self._node_actions(
+            environment, self._valid_actions(environment), descent.symmetry
+        )
+
+    def _valid_actions(self, environment):
+        """Returns the environment's valid action mask, or its list of actions if it has no mask"""
+        mask = getattr(environment, "action_mask", None)
+        return environment.actions if mask is None else mask
+
+    def _node_actions(self, environment, actions, symmetry):
+        """Maps environment actions, or an action mask, into the frame of a node with the given symmetry"""
+        if symmetry is None:
+            return actions
+
+        if isinstance(actions, np.ndarray) and actions.dtype == bool:
+            # Node action c is valid if its environment action is
+            return actions[self._inverse(environment)[symmetry]]
+
+        return environment.symmetries[symmetry][actions].tolist()
+
+    def _environment_action(self, environment, action, symmetry):
+        """Maps an action of a node with the given symmetry to the environment's action"""
+        return int(self._inverse(environment)[symmetry][action])
+
+    def _inverse(self, environment):
+        """Returns the inverse action permutations of the environment's symmetries"""
+        symmetries, inverse = self._inverse_symmetries
+        if symmetries is not environment.symmetries:
+            symmetries = environment.symmetries
+            inverse = np.argsort(symmetries, axis=1)
+            self._inverse_symmetries = (symmetries, inverse)
+
+        return inverse
+
+
+# The MCTS searched by a root-parallel worker process
+_worker_mcts = None
+
+
+# Holds each worker at the start of a task until every worker has one
+_worker_barrier = None
+
+
+def _init_worker(
+    raw_config, tree, tree_kwargs, clock_check_interval, instrument, barrier
+):
+    global _worker_mcts, _worker_barrier
+    _worker_barrier = barrier
+    _worker_mcts = MCTS(
+        None,
+        tree=tree,
+        tree_kwargs=tree_kwargs,
+        clock_check_interval=clock_check_interval,
+        instrument=instrument,
+    )
+    _worker_mcts.build(raw_config)
+
+
+def _search_worker(task):
+    """Searches a new tree from the environment in `task` and returns the root edge statistics.
+
+    Each worker takes exactly one task of a search, so the trees are independent and
+    the statistics of a fixed budget depend only on the seeds."""
+    environment, budget, seed = task
+    _worker_barrier.wait()
+    np.random.seed(seed)
+
+    mcts = _worker_mcts
+    mcts.reset()
+    mcts.environment = environment
+    root, _ = mcts._lookup(environment)
+    result = mcts.search(root, **budget)
+
+    if not root.expanded:
+        return [], [], [], result
+
+    return root.actions.tolist(), root.n.tolist(), root.w.tolist(), result
@@ -37,6 +37,9 @@ class Model:
 
         self.kwargs = kwargs
 
+        # Incremented whenever the weights change, so cached evaluations can be invalidated
+        self.version = 0
+
     def clone(self):
         """Makes a compiled clone of the current model."""
         # Save and restore a model
@@ -73,5 +76,34 @@ class Model:
         with self._graph.as_default():
             return self.model.predict(X)
 
+    def set_weights(self, weights):
+        """Sets the weights of the model and increments its version."""
+        self.model.set_weights(weights)
+        self.version += 1
+
+    def load_weights(self, *args, **kwargs):
+        """Loads the weights of the model and increments its version."""
+        result = self.model.load_weights(*args, **kwargs)
+        self.version += 1
+        return result
+
+    def fit(self, *args, **kwargs):
+        """Trains the model and increments its version."""
+        result = self.model.fit(*args, **kwargs)
+        self.version += 1
+        return result
+
+    def fit_generator(self, *args, **kwargs):
+        """Trains the model from a generator and increments its version."""
+        result = self.model.fit_generator(*args, **kwargs)
+        self.version += 1
+        return result
+
+    def train_on_batch(self, *args, **kwargs):
+        """Trains the model on a single batch and increments its version."""
+        result = self.model.train_on_batch(*args, **kwargs)
+        self.version += 1
+        return result
+
     def __getattr__(self, attr):
         return self.model.__getattribute__(attr)
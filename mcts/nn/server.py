@@ -0,0 +1,169 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import logwood
+import numpy as np
+
+# Placed on the request queue to stop the serving thread
+_STOP = object()
+
+
+class InferenceServer:
+    """Serves predictions from one model to many concurrent searches.
+
+    Searches submit states from any thread (or coroutine). A serving thread
+    collects the pending requests into a single batch, up to `max_batch_size`
+    states or until `max_latency` seconds have passed since the first request
+    of the batch arrived, runs one prediction and hands each search its part
+    of the outputs.
+
+    The server exposes `predict` and `predict_from_node` like mcts.nn.model.Model,
+    so it can be given to NNExpansion in place of a model.
+    """
+
+    def __init__(self, model, max_batch_size=64, max_latency=0.002, name=None):
+        """Initializes an InferenceServer and starts serving.
+
+        Arguments:
+            model {mcts.nn.model.Model} -- The model used for predictions
+
+        Keyword Arguments:
+            max_batch_size {int} -- Maximum number of states in a batch (default: {64})
+            max_latency {float} -- Maximum time in seconds to wait for a batch to fill (default: {0.002})
+            name {str} -- Name used for logging (default: {None})
+        """
+        if name is None:
+            name = self.__class__.__name__
+
+        self._logger = logwood.get_logger(name)
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+
+        # Serving statistics
+        self.requests = 0
+        self.batches = 0
+        self.states = 0
+
+        self._requests = queue.Queue()
+        self._thread = None
+        self.start()
+
+    @property
+    def version(self):
+        """The version of the served model's weights."""
+        return getattr(self.model, "version", 0)
+
+    @property
+    def mean_batch_size(self):
+        if self.batches == 0:
+            return 0
+
+        return self.states / self.batches
+
+    def start(self):
+        """Starts the serving thread if it is not running."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._serve, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the serving thread once pending requests are served."""
+        if self._thread is not None:
+            self._requests.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, X):
+        """Submits states for prediction without waiting for the result.
+
+        Arguments:
+            X {numpy.array} -- A batch of state inputs
+
+        Returns:
+            concurrent.futures.Future -- Resolves to the model outputs for X
+        """
+        future = Future()
+        self._requests.put((X, future))
+        return future
+
+    def predict(self, X):
+        """Runs a prediction as part of the next batch and waits for the result.
+
+        Arguments:
+            X {numpy.array} -- A batch of state inputs
+
+        Returns:
+            list -- The model outputs for X
+        """
+        return self.submit(X).result()
+
+    def predict_from_node(self, node, **kwargs):
+        """Runs a prediction from an mcts.tree.Node object directly
+
+        Arguments:
+            node {mcts.tree.Node} -- The node on which the model is meant to predict
+
+        Returns:
+            list -- The model outputs for the state of the node
+        """
+        return self.predict(np.expand_dims(node.state, axis=0))
+
+    async def predict_async(self, X):
+        """Runs a prediction as part of the next batch from a coroutine."""
+        return await asyncio.wrap_future(self.submit(X))
+
+    def _serve(self):
+        while True:
+            request = self._requests.get()
+            if request is _STOP:
+                return
+
+            batch = [request]
+            size = len(request[0])
+            deadline = time.monotonic() + self.max_latency
+            stopping = False
+
+            # Fill the batch until it is full or the first request has waited long enough
+            while size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+
+                try:
+                    request = self._requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+                if request is _STOP:
+                    stopping = True
+                    break
+
+                batch.append(request)
+                size += len(request[0])
+
+            self._run_batch(batch)
+            if stopping:
+                return
+
+    def _run_batch(self, batch):
+        try:
+            outputs = self.model.predict(np.concatenate([X for X, _ in batch]))
+        except Exception as e:
+            self._logger.error("Prediction failed: {}".format(e))
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.requests += len(batch)
+        self.batches += 1
+
+        start = 0
+        for X, future in batch:
+            stop = start + len(X)
+            future.set_result([output[start:stop] for output in outputs])
+            start = stop
+        self.states += start
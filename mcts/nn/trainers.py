@@ -1,4 +1,5 @@
 from ..mcts import MCTS
+from ..selfplay import LockstepSelfPlay
 from ..utils import play_game, node_to_probability_distribution
 
 import numpy as np
@@ -49,7 +50,13 @@ class StagedModelTrainer:
         self._logger = logwood.get_logger(self.__class__.__name__)
 
     def train(
-        self, epochs=10, generation_steps=100, training_steps=100, evaluation_steps=10
+        self,
+        epochs=10,
+        generation_steps=100,
+        training_steps=100,
+        evaluation_steps=10,
+        parallel_games=1,
+        simulations=100,
     ):
         """Trains the model in stages.
         
@@ -58,19 +65,43 @@ class StagedModelTrainer:
             generation_steps {int} -- The number of games played to generate data points during the generation stage. (default: {100})
             training_steps {int} -- The number of batches to train on. (default: {100})
             evaluation_steps {int} -- The number of evaluation games to play for model evaluation. (default: {10})
+            parallel_games {int} -- The number of generation games played at once with a `LockstepSelfPlay`.
+                The number of games is rounded up to a multiple of it. (default: {1})
+            simulations {int} -- The number of simulations per move when games are played at once (default: {100})
         """
-        mcts = MCTS(self.environment)
-        mcts.build(self.config)
-        mcts.calculation_time = 1  # TODO: Allow this to be included in config
+        if parallel_games > 1:
+            selfplay = LockstepSelfPlay(
+                self.environment,
+                self.config,
+                games=parallel_games,
+                simulations=simulations,
+            )
+        else:
+            mcts = MCTS(self.environment)
+            mcts.build(self.config)
+            mcts.calculation_time = 1  # TODO: Allow this to be included in config
         for epoch in range(epochs):
             self._logger.info("Starting epoch {}".format(epoch))
             # Generate Data
 
             self._logger.info("Entering Generation Phase")
-            for i in range(generation_steps):
-                self._logger.info("Playing Generation Game {}".format(i))
-                game_results, reward, winner = play_game(mcts)
-                self._process_and_store(mcts, game_results, reward, winner)
+            if parallel_games > 1:
+                for i in range(0, generation_steps, parallel_games):
+                    self._logger.info(
+                        "Playing Generation Games {} to {}".format(
+                            i, i + parallel_games - 1
+                        )
+                    )
+                    results = selfplay.play()
+                    for m, (game_results, reward, winner) in zip(
+                        selfplay.searches, results
+                    ):
+                        self._process_and_store(m, game_results, reward, winner)
+            else:
+                for i in range(generation_steps):
+                    self._logger.info("Playing Generation Game {}".format(i))
+                    game_results, reward, winner = play_game(mcts)
+                    self._process_and_store(mcts, game_results, reward, winner)
 
             # Save replay table
             if self.replay_path:
@@ -4,19 +4,23 @@ from ..utils import node_to_probability_distribution
 
 
 class MostVisited(BasePolicy):
-    """Chooses the most visited child node of a given node."""
+    """Chooses the most visited child node of a given node.
+
+    Actions proven to win are chosen regardless of their visits, and actions
+    proven to lose are avoided unless every action loses."""
 
     def __call__(self, node):
-        edges = node.edges
-        best_action = list(edges.keys())[0]
-        most_visited = 0
+        proof = node.proof
+        wins = proof == 1
+        if wins.any():
+            return int(node.actions[wins.argmax()])
 
-        for action, child in edges.items():
-            if child.n > most_visited:
-                best_action = action
-                most_visited = child.n
+        visits = node.n
+        losses = proof == -1
+        if losses.any() and not losses.all():
+            visits = np.where(losses, -1, visits)
 
-        return best_action
+        return int(node.actions[visits.argmax()])
 
 
 class ProportionalToVisitCount(BasePolicy):
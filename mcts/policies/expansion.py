@@ -1,40 +1,244 @@
 from ..base.policy import NodeTrackingPolicy
-from ..utils import softmax
+from ..cache import EvaluationCache
+from ..utils import softmax, valid_actions
+import numpy as np
+import threading
+import time
 import xxhash
 
 
 class VanillaExpansion(NodeTrackingPolicy):
     """Expands the leaf node by adding possible actions
-    as edges to the node."""
+    as edges to the node.
+
+    Expansion policies are given the valid actions either as a list of actions or
+    as a boolean mask over the action space."""
 
     def __call__(self, node, actions):
 
         node.expanded = True
-        node.set_edges(actions)
+        node.set_edges(valid_actions(actions))
 
 
 class NNExpansion(NodeTrackingPolicy):
     """Expands a node using priors based on a neural net.
     
-    As of now, only neural nets with both a value-output and a policy-output will be supported."""
+    As of now, only neural nets with both a value-output and a policy-output will be supported.
+
+    With a `batch_size` greater than one, the MCTS collects that many leaves per round
+    and evaluates them with a single prediction.
+
+    With a `cache`, evaluations are kept across searches and games, and states that
+    were evaluated before by the same model version are not predicted again."""
+
+    def __init__(self, model, batch_size=1, cache=None):
+        """Initializes the expansion policy.
 
-    def __init__(self, model):
+        Arguments:
+            model {mcts.nn.model.Model} -- The model used to evaluate states
+
+        Keyword Arguments:
+            batch_size {int} -- Number of leaves evaluated per prediction (default: {1})
+            cache {int or mcts.cache.EvaluationCache} -- An evaluation cache, or the maximum size of a new one (default: {None})
+        """
         self.model = model
+        self.batch_size = batch_size
+
+        if isinstance(cache, int):
+            cache = EvaluationCache(max_size=cache)
+        self.cache = cache
+
+        # Number of model calls and the seconds spent in them. Search threads
+        # evaluate outside of the tree lock, so the counts have their own.
+        self.calls = 0
+        self.latency = 0.0
+        self._calls_lock = threading.Lock()
 
     def __call__(self, node, actions):
         """Performs expansion on node.
         
         Arguments:
             node {mcts.tree.Node} -- The node to expand.
-            actions {numpy.array[int]} -- Available actions at this state
+            actions {numpy.array} -- Available actions at this state, or a boolean mask of them
         """
-        node.expanded = True
+        self.apply(node, actions, self.evaluate(node))
+
+    def evaluate(self, node):
+        """Runs the model on the state of a node without modifying the tree.
+
+        Returns:
+            tuple -- The priors over all actions and the value predicted by the model
+        """
+        if self.cache is not None:
+            evaluation = self.cache.get(self.model, node.id)
+            if evaluation is not None:
+                return evaluation
+
+        begin = time.perf_counter()
         policy_logits, value = self.model.predict_from_node(node)
+        self._count_call(begin)
+
+        evaluation = self._evaluation(policy_logits[0], value[0])
+        if self.cache is not None:
+            self.cache.put(self.model, node.id, evaluation)
+        return evaluation
 
+    def evaluate_batch(self, nodes):
+        """Runs the model on the states of several nodes in one prediction.
+
+        Returns:
+            list -- The evaluation of each node, in the form returned by `evaluate`
+        """
+        evaluations = [None] * len(nodes)
+        if self.cache is not None:
+            evaluations = [self.cache.get(self.model, node.id) for node in nodes]
+
+        missing = [i for i, evaluation in enumerate(evaluations) if evaluation is None]
+        if not missing:
+            return evaluations
+
+        begin = time.perf_counter()
+        policy_logits, values = self.model.predict(
+            np.stack([nodes[i].state for i in missing])
+        )
+        self._count_call(begin)
+
+        for j, i in enumerate(missing):
+            evaluations[i] = self._evaluation(policy_logits[j], values[j])
+            if self.cache is not None:
+                self.cache.put(self.model, nodes[i].id, evaluations[i])
+        return evaluations
+
+    def _count_call(self, begin):
+        latency = time.perf_counter() - begin
+        with self._calls_lock:
+            self.latency += latency
+            self.calls += 1
+
+    def apply(self, node, actions, evaluation):
+        """Expands a node with an evaluation returned by `evaluate`."""
+        priors, value = evaluation
+        node.expanded = True
+
+        actions = valid_actions(actions)
+        node.set_edges(actions, priors=self._valid_priors(priors, actions))
+        node.set_value(value)
+
+    def _valid_priors(self, priors, actions):
+        # Renormalizing over the valid actions is the softmax of the masked logits
+        valid_priors = priors[actions]
+        return valid_priors / valid_priors.sum()
+
+    def _evaluation(self, policy_logits, value):
         # The policy output is in logit form.
         # We need to softmax it to turn it into priors.
-        priors = softmax(policy_logits[0])
-        valid_priors = priors[actions]
+        return softmax(policy_logits), value[0]
+
+
+class ProgressiveWidening:
+    """Adds the edges of a node a few at a time as its visit count grows.
+
+    A node with `visits` visits has ceil(widening_constant * (visits + 1) ** widening_exponent)
+    edges, taken from its actions in order of priority. The remaining actions are kept
+    in `node.pending` until the MCTS widens the node during selection.
+
+    Only actions that are edges of a node can be selected, so with progressive widening
+    the expansion rollout should be `random-unvisited` or left out."""
+
+    def __init__(self, widening_constant=2, widening_exponent=0.5):
+        self.widening_constant = widening_constant
+        self.widening_exponent = widening_exponent
+
+    def width(self, visits):
+        """Returns the number of edges a node with `visits` visits may have."""
+        return int(
+            np.ceil(self.widening_constant * (visits + 1) ** self.widening_exponent)
+        )
+
+    def widen(self, node, width=None):
+        """Adds pending actions as edges until the node has `width` edges.
+
+        Arguments:
+            node {mcts.tree.Node} -- An expanded node
+
+        Keyword Arguments:
+            width {int} -- The number of edges to widen to. Defaults to the width for the visits of the node. (default: {None})
+        """
+        if node.pending is None:
+            return
+
+        if width is None:
+            width = self.width(node.visits)
+        k = width - len(node.actions)
+        if k <= 0:
+            return
+
+        actions, priors = node.pending
+        node.add_edges(actions[:k], priors[:k])
+        node.pending = (actions[k:], priors[k:]) if k < len(actions) else None
+
+    def _set_widening_edges(self, node, actions, priorities, priors=[]):
+        """Sets the first edges of a node in order of decreasing priority."""
+        order = np.argsort(-np.asarray(priorities), kind="stable")
+        actions = np.asarray(actions)[order].tolist()
+        if len(priors) == 0:
+            priors = np.zeros(len(actions))
+        priors = np.asarray(priors)[order]
+
+        k = self.width(0)
+        node.set_edges(actions[:k], priors=priors[:k])
+        node.pending = (actions[k:], priors[k:]) if k < len(actions) else None
+
+
+class ProgressiveExpansion(NodeTrackingPolicy, ProgressiveWidening):
+    """Expands the leaf node with progressive widening.
+
+    Actions are ordered by `heuristic(state, actions)`, which returns a score for
+    each action, highest first. Without a heuristic, actions are added in a random order."""
+
+    def __init__(self, heuristic=None, widening_constant=2, widening_exponent=0.5):
+        ProgressiveWidening.__init__(self, widening_constant, widening_exponent)
+        self.heuristic = heuristic
+
+    def __call__(self, node, actions):
+        node.expanded = True
+        actions = valid_actions(actions)
+        if self.heuristic is None:
+            priorities = np.random.random(len(actions))
+        else:
+            priorities = self.heuristic(node.state, actions)
+
+        self._set_widening_edges(node, actions, priorities)
+
+
+class ProgressiveNNExpansion(NNExpansion, ProgressiveWidening):
+    """Expands a node using priors based on a neural net, with progressive widening.
+
+    Actions are added in order of decreasing prior."""
+
+    def __init__(
+        self,
+        model,
+        batch_size=1,
+        cache=None,
+        widening_constant=2,
+        widening_exponent=0.5,
+    ):
+        NNExpansion.__init__(self, model, batch_size=batch_size, cache=cache)
+        ProgressiveWidening.__init__(self, widening_constant, widening_exponent)
+
+    def _count_call(self, begin):
+        latency = time.perf_counter() - begin
+        with self._calls_lock:
+            self.latency += latency
+            self.calls += 1
+
+    def apply(self, node, actions, evaluation):
+        """Expands a node with an evaluation returned by `evaluate`."""
+        priors, value = evaluation
+        node.expanded = True
 
-        node.set_edges(actions, priors=valid_priors)
-        node.set_value(value[0][0])
+        actions = valid_actions(actions)
+        valid_priors = self._valid_priors(priors, actions)
+        self._set_widening_edges(node, actions, valid_priors, priors=valid_priors)
+        node.set_value(value)
@@ -4,17 +4,28 @@ import numpy as np
 
 class RandomChoice(BasePolicy):
     def __call__(self, node, environment):
-        return np.random.choice(environment.actions)
+        mask = getattr(environment, "action_mask", None)
+        if mask is None:
+            return np.random.choice(environment.actions)
+
+        actions = np.flatnonzero(mask)
+        return actions[np.random.randint(len(actions))]
+
+
+class RandomEdge(BasePolicy):
+    """Chooses a random edge of an expanded node as the expansion rollout."""
+
+    def __call__(self, node, environment):
+        return np.random.choice(node.actions)
 
 
 class RandomUnvisited(BasePolicy):
     def __call__(self, node, environment):
 
         if node.expanded:
-            unvisited_actions = [a for a, edge in node.edges.items() if edge.n == 0]
-            return np.random.choice(
-                np.intersect1d(unvisited_actions, environment.actions)
-            )
+            # The edges of a node are the valid actions of its state
+            unvisited_actions = node.actions[node.n == 0]
+            return np.random.choice(unvisited_actions)
         # If the node is a leaf node
         else:
             return environment.actions
@@ -11,15 +11,80 @@ class UCB1(BasePolicy):
         super().__init__()
 
     def __call__(self, node):
-        actions = node.edges.keys()
+        return int(node.actions[self.values(node).argmax()])
 
-        log_n = np.log(sum([node[action].n for action in actions]) + 1)
-        ucb1_values = [
-            [action, node[action].q + self.C * np.sqrt(log_n / (node[action].n + 1))]
-            for action in actions
-        ]
-        action, value = max(ucb1_values, key=lambda x: x[1])
-        return action
+    def values(self, node):
+        """Returns the UCB1 value of each edge of the node."""
+        n = node.n
+        q = np.divide(node.w, n, out=np.zeros(n.shape[0]), where=n > 0)
+
+        log_n = np.log(node.visits + 1)
+        return q + self.C * np.sqrt(log_n / (n + 1))
+
+
+class SolverUCB1(UCB1):
+    """UCB1 selection for MCTS-Solver.
+
+    Edges proven to win for the player on move are always selected, and edges
+    proven to lose are skipped unless every edge loses. Use with the `solver`
+    update policy."""
+
+    def __call__(self, node):
+        proof = node.proof
+        wins = proof == 1
+        if wins.any():
+            return int(node.actions[wins.argmax()])
+
+        values = self.values(node)
+        losses = proof == -1
+        if not losses.all():
+            values[losses] = -np.inf
+
+        return int(node.actions[values.argmax()])
+
+
+class RAVEUCB1(UCB1):
+    """UCB1 selection on values blended with all-moves-as-first (AMAF) statistics.
+
+    The value of an edge is (1 - beta) * Q + beta * AMAF, where beta falls from 1
+    towards 0 as the edge gains visits. With the `equivalence` schedule,
+    beta = sqrt(k / (3 * n + k)), so Q and AMAF have equal weight after k visits.
+    With the `mse` schedule, beta = n_amaf / (n + n_amaf + 4 * b ** 2 * n * n_amaf),
+    where b is the expected bias of AMAF values. A callable schedule(n, n_amaf) may
+    also be given. Use with the `rave` update policy."""
+
+    def __init__(self, C=1.41, schedule="equivalence", k=1000, b=0.1):
+        super().__init__(C=C)
+        if not callable(schedule) and schedule not in ("equivalence", "mse"):
+            raise ValueError("{} is not a supported RAVE schedule.".format(schedule))
+        self.schedule = schedule
+        self.k = k
+        self.b = b
+
+    def values(self, node):
+        n = node.n
+        amaf_n = node.amaf_n
+        q = np.divide(node.w, n, out=np.zeros(n.shape[0]), where=n > 0)
+        amaf_q = np.divide(
+            node.amaf_w, amaf_n, out=np.zeros(n.shape[0]), where=amaf_n > 0
+        )
+
+        beta = self.beta(n, amaf_n)
+        log_n = np.log(node.visits + 1)
+        return (1 - beta) * q + beta * amaf_q + self.C * np.sqrt(log_n / (n + 1))
+
+    def beta(self, n, amaf_n):
+        """Returns the weight of the AMAF value of each edge."""
+        if callable(self.schedule):
+            return self.schedule(n, amaf_n)
+
+        if self.schedule == "equivalence":
+            return np.sqrt(self.k / (3 * n + self.k))
+
+        denominator = n + amaf_n + 4 * self.b ** 2 * n * amaf_n
+        return np.divide(
+            amaf_n, denominator, out=np.zeros(n.shape[0]), where=denominator > 0
+        )
 
 
 class PUCT:
@@ -31,17 +96,10 @@ class PUCT:
         super().__init__()
 
     def __call__(self, node):
-
-        edges = node.edges
-        arr = np.array(
-            [[action, edge.p, edge.n, edge.q] for action, edge in edges.items()]
-        )
+        n = node.n
+        q = np.divide(node.w, n, out=np.zeros(n.shape[0]), where=n > 0)
 
         # PUCT formula
-        qus = arr[:, 3] + self.C * arr[:, 1] * np.sqrt(np.sum(arr[:, 2])) / (
-            arr[:, 2] + 1
-        )
-
-        arr[qus.argmax(), 0]
+        qus = q + self.C * node.p * np.sqrt(node.visits) / (n + 1)
 
-        return arr[qus.argmax(), 0].astype(int)
+        return int(node.actions[qus.argmax()])
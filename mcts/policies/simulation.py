@@ -1,5 +1,6 @@
 from ..base.policy import BasePolicy
 from .rollout import RandomChoice
+import numpy as np
 
 
 class RandomToEnd(BasePolicy):
@@ -7,11 +8,69 @@ class RandomToEnd(BasePolicy):
         self.rollout = RandomChoice()
         super().__init__()
 
-    def __call__(self, current, environment):
-        action = self.rollout(current, environment)
-        observation, reward, done = environment.step(action)
+    def __call__(self, current, environment, moves=None):
+        """Plays random actions until the game ends.
+
+        If a `moves` list is given, each move is appended to it as [player, action]."""
+        # Environments with the push/pop protocol are stepped in place,
+        # and the MCTS unwinds the rollout after the update
+        step = getattr(environment, "push", environment.step)
+
+        # Only the final observation is built if the environment allows it
+        if getattr(environment, "lazy_observations", False):
+            done = False
+            while not done:
+                action = self.rollout(current, environment)
+                if moves is not None:
+                    moves.append([environment.player, action])
+                reward, done = step(action, observe=False)
+
+            return environment.state, reward, done
+
+        done = False
         while not done:
             action = self.rollout(current, environment)
-            observation, reward, done = environment.step(action)
+            if moves is not None:
+                moves.append([environment.player, action])
+            observation, reward, done = step(action)
 
         return observation, reward, done
+
+
+class VectorizedRandomToEnd(BasePolicy):
+    """Plays many random games from the leaf at once and averages their outcomes.
+
+    Environments that implement `random_playouts` play all of the games together as
+    array operations, and are not changed. The outcome is each player's share of the
+    games, with draws split evenly, which the update policy backs up in place of the
+    winner of a single game. Other environments are played to the end once with
+    `RandomToEnd`, and no outcome is returned."""
+
+    # The MCTS passes the outcome to the update policy
+    returns_outcome = True
+
+    def __init__(self, playouts=16):
+        """Initializes the policy.
+
+        Keyword Arguments:
+            playouts {int} -- The number of games played from each leaf (default: {16})
+        """
+        self.playouts = playouts
+        self._fallback = RandomToEnd()
+        super().__init__()
+
+    def __call__(self, current, environment):
+        """Plays random games from the environment to the end.
+
+        Returns:
+            tuple -- The observation, reward, done flag and the share of the games won by
+                each player, or None if a single game was played on the environment
+        """
+        if not hasattr(environment, "random_playouts"):
+            return self._fallback(current, environment) + (None,)
+
+        winners = environment.random_playouts(self.playouts)
+        wins = np.bincount(winners, minlength=environment.n_players + 1)
+        outcome = (wins[1:] + wins[0] / environment.n_players) / self.playouts
+
+        return None, 0, False, outcome
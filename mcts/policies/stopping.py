@@ -0,0 +1,48 @@
+from ..base.policy import BasePolicy
+
+
+class VisitMarginStop(BasePolicy):
+    """Stops a search once the most visited root action can no longer be overtaken.
+
+    This suits the `most-visited` action policy. For `proportional-to-visit-count`,
+    set `min_fraction` so that the search also continues until the leading action
+    holds at least that fraction of the visits the root would have at the end of
+    the budget."""
+
+    def __init__(self, check_interval=16, min_fraction=None):
+        """Initializes the stopping policy.
+
+        Keyword Arguments:
+            check_interval {int} -- Number of simulations between checks (default: {16})
+            min_fraction {float} -- Minimum share of the final root visits held by the leading action (default: {None})
+        """
+        self.check_interval = check_interval
+        self.min_fraction = min_fraction
+        super().__init__()
+
+    def __call__(self, node, remaining):
+        """Decides whether the search from `node` can stop.
+
+        Arguments:
+            node {mcts.tree.Node} -- The root of the search
+            remaining {float} -- The estimated number of simulations left in the budget
+
+        Returns:
+            bool -- True if the remaining simulations cannot change the choice
+        """
+        if not node.expanded:
+            return False
+
+        n = node.n
+        if len(n) < 2:
+            return True
+
+        leader = n.max()
+        runner_up = n[n.argpartition(-2)[-2]]
+        if leader - runner_up <= remaining:
+            return False
+
+        if self.min_fraction is not None:
+            return leader >= self.min_fraction * (n.sum() + remaining)
+
+        return True
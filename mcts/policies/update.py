@@ -1,15 +1,37 @@
 from ..base.policy import NodeTrackingPolicy
+from ..utils import proven_value
 import numpy as np
 
 
 class VanillaUpdate(NodeTrackingPolicy):
     """The update policy that follows vanilla MCTS practices."""
 
-    def __call__(self, environment, reward, history):
+    def __call__(self, environment, reward, history, outcome=None):
         """Updates the nodes in the node tree.
         
-        Increments visit count and win count if the node is winning"""
+        Increments visit count and win count if the node is winning. If the simulation
+        played several games, `outcome` holds the share of them won by each player, and
+        the win count grows by the share of the node's player instead."""
+        if outcome is None:
+            self._update(history, self._winner(environment))
+        else:
+            self._update_shares(history, outcome)
+
+    def _update(self, history, winner):
+        for node_id, action in history:
+
+            node = self.tree.get_by_id(node_id)
+            node[action].n += 1
+            if node.player == winner:
+                node[action].w += 1
 
+    def _update_shares(self, history, outcome):
+        for node_id, action in history:
+            node = self.tree.get_by_id(node_id)
+            node[action].n += 1
+            node[action].w += outcome[node.player - 1]
+
+    def _winner(self, environment):
         winner = environment.winner
 
         # No winner means a draw-state was reached
@@ -19,12 +41,7 @@ class VanillaUpdate(NodeTrackingPolicy):
             # value of 0.5 for draw-states
             winner = np.random.randint(environment.n_players) + 1
 
-        for node_id, action in history:
-
-            node = self.tree.get_by_id(node_id)
-            node[action].n += 1
-            if node.player == winner:
-                node[action].w += 1
+        return winner
 
 
 class ValueUpdate(NodeTrackingPolicy):
@@ -32,7 +49,8 @@ class ValueUpdate(NodeTrackingPolicy):
 
     def __call__(self, environment, reward, history):
 
-        node = self.tree.get_by_state(environment.state)
+        state, key, _ = self.tree.node_key(environment, environment.state)
+        node = self.tree.get_by_state(state, key=key)
 
         # If the environment is terminal then the value is the reward
         if environment.terminal:
@@ -49,3 +67,81 @@ class ValueUpdate(NodeTrackingPolicy):
                 node[action].w += reward
             else:
                 node[action].w -= reward
+
+
+class SolverUpdate(VanillaUpdate):
+    """The update policy for MCTS-Solver in two-player games.
+
+    Besides the vanilla update, edges that lead straight to the end of the game are
+    proven as a win, draw or loss for the player who took them. Proofs are then
+    propagated up the searched path with minimax rules: a node is won if any of its
+    edges wins, and lost or drawn once all of its edges are proven (see
+    `mcts.utils.proven_value`). Use with the `solver-ucb1` selection policy."""
+
+    def __call__(self, environment, reward, history, outcome=None):
+        super().__call__(environment, reward, history, outcome)
+        if not history or not environment.terminal:
+            return
+
+        # Only a terminal state reached within the tree proves anything,
+        # not one reached by the simulation
+        node_id, action = history[-1]
+        node = self.tree.get_by_id(node_id)
+        edge = node[action]
+        state, key, _ = self.tree.node_key(environment, None)
+        state_id = self.tree.state_id(state, key)
+        if not edge.evaluated or edge.node.id != state_id:
+            return
+
+        winner = environment.winner
+        if winner is None:
+            edge.proof = 0
+        else:
+            edge.proof = 1 if node.player == winner else -1
+
+        for node_id, action in reversed(history[:-1]):
+            value = proven_value(node)
+            if np.isnan(value):
+                return
+
+            parent = self.tree.get_by_id(node_id)
+            parent[action].proof = value if parent.player == node.player else -value
+            node = parent
+
+
+class RAVEUpdate(VanillaUpdate):
+    """The vanilla update with all-moves-as-first (AMAF) statistics for RAVE.
+
+    Every action a player takes after a node, in the tree or in the simulation,
+    counts as a visit of that action's edge at the node if the same player is on
+    move there. Only the first time the action is taken counts. The statistics are
+    kept in `amaf_n` and `amaf_w` of each node. Use with the `rave-ucb1` selection
+    policy."""
+
+    # The MCTS passes the moves of the simulation to this policy
+    records_rollout = True
+
+    def __call__(self, environment, reward, history, moves=()):
+        """Updates the nodes in the node tree.
+
+        Arguments:
+            environment {object} -- The environment at the end of the simulation
+            reward {float} -- The reward of the simulation
+            history {list} -- The [node_id, action] pairs of the search path
+
+        Keyword Arguments:
+            moves {list} -- The [player, action] pairs of the simulation (default: {()})
+        """
+        winner = self._winner(environment)
+        self._update(history, winner)
+
+        nodes = [self.tree.get_by_id(node_id) for node_id, _ in history]
+        played = [[node.player, action] for node, (_, action) in zip(nodes, history)]
+        played.extend(moves)
+
+        for i, node in enumerate(nodes):
+            actions = [action for player, action in played[i:] if player == node.player]
+            taken = np.isin(node.actions, actions)
+            node.amaf_n[taken] += 1
+            if node.player == winner:
+                node.amaf_w[taken] += 1
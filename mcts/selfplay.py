@@ -0,0 +1,137 @@
+from contextlib import ExitStack
+from .mcts import MCTS
+import numpy as np
+
+
+class LockstepSelfPlay:
+    """Plays several self-play games at once, with their searches advancing in lockstep.
+
+    The games are held in the vectorized form of the environment, and each game has
+    its own MCTS. In every round of a move's search, each unfinished game descends to
+    one leaf. The leaves of all games are then expanded together: expansion policies
+    that share a model evaluate them in a single prediction. Once the searches are
+    done, the chosen moves of all games are taken with one batched step."""
+
+    def __init__(
+        self,
+        environment,
+        config,
+        games=8,
+        simulations=100,
+        tree="dict",
+        tree_kwargs=None,
+    ):
+        """Initializes a LockstepSelfPlay.
+
+        Arguments:
+            environment {object} -- An environment with a `vectorized` method, such as `TicTacToe`
+            config {dict} -- The configuration of the MCTS of each game
+
+        Keyword Arguments:
+            games {int} -- The number of games played at once (default: {8})
+            simulations {int} -- The number of simulations of each move's search (default: {100})
+            tree {str} -- The type of the search trees (default: {"dict"})
+            tree_kwargs {dict} -- Keyword arguments for the search trees (default: {None})
+        """
+        self.environments = environment.vectorized(games)
+        self.simulations = simulations
+        self.searches = []
+        for _ in range(games):
+            mcts = MCTS(None, tree=tree, tree_kwargs=tree_kwargs)
+            mcts.build(config)
+            self.searches.append(mcts)
+
+    def play(self):
+        """Plays a new game in each environment to the end.
+
+        The search tree of each game is kept in `searches` until the next call.
+
+        Returns:
+            list -- The game history, final reward and winner of each game, as returned by `mcts.utils.play_game`
+        """
+        environments = self.environments
+        environments.reset()
+        for mcts in self.searches:
+            mcts.reset()
+
+        rewards = np.zeros(environments.n_envs, dtype=int)
+        while not environments.terminal.all():
+            playing = np.flatnonzero(~environments.terminal)
+            searches = [self.searches[i] for i in playing]
+            roots = []
+            for i, mcts in zip(playing, searches):
+                mcts.environment = environments.environment(i)
+                roots.append(mcts._start_move())
+
+            self._search(searches, [root for root, _ in roots])
+
+            # Actions of finished games are ignored by the step
+            actions = np.zeros(environments.n_envs, dtype=int)
+            for i, mcts, (root, symmetry) in zip(playing, searches, roots):
+                action = mcts.choose(root)
+                if symmetry is not None:
+                    action = mcts._environment_action(
+                        mcts.environment, action, symmetry
+                    )
+                actions[i] = action
+
+            step_rewards, _ = environments.step(actions, observe=False)
+            rewards[playing] = step_rewards[playing]
+
+        return [
+            (mcts.game_history, int(rewards[i]), int(environments.winner[i]) or None)
+            for i, mcts in enumerate(self.searches)
+        ]
+
+    def _search(self, searches, roots):
+        """Runs the searches of a move together, one simulation of each per round."""
+        starts = [mcts._start_stats() for mcts in searches]
+        max_depths = [0] * len(searches)
+        total_depths = [0] * len(searches)
+
+        with ExitStack() as stack:
+            for mcts in searches:
+                stack.enter_context(mcts._scratch_environment())
+
+            for _ in range(self.simulations):
+                descents = [
+                    mcts._descend(root) for mcts, root in zip(searches, roots)
+                ]
+                try:
+                    self._expand(searches, descents)
+                except Exception:
+                    for mcts, descent in zip(searches, descents):
+                        mcts._abandon(descent)
+                    raise
+
+                for j, (mcts, descent) in enumerate(zip(searches, descents)):
+                    depth = mcts._complete(descent)
+                    total_depths[j] += depth
+                    max_depths[j] = max(max_depths[j], depth)
+
+        for j, (mcts, start) in enumerate(zip(searches, starts)):
+            mcts.last_search = mcts._finish_stats(
+                start, self.simulations, max_depths[j], total_depths[j], None, False
+            )
+
+    def _expand(self, searches, descents):
+        """Expands the leaves of the descents, evaluating those whose policies share a model in one batch."""
+        batches = {}
+        for mcts, descent in zip(searches, descents):
+            if not descent.expanding:
+                continue
+
+            if hasattr(mcts.expand, "evaluate_batch"):
+                batches.setdefault(id(mcts.expand.model), []).append((mcts, descent))
+            else:
+                mcts._expand(descent.current, mcts._leaf_actions(descent))
+
+        for batch in batches.values():
+            # The first policy evaluates the leaves of all games, so its statistics count the call
+            evaluations = batch[0][0].expand.evaluate_batch(
+                [descent.current for _, descent in batch]
+            )
+            for (mcts, descent), evaluation in zip(batch, evaluations):
+                mcts.expand.apply(
+                    descent.current, mcts._leaf_actions(descent), evaluation
+                )
@@ -0,0 +1,116 @@
+PHASES = ("selection", "expansion", "expansion_rollout", "simulation", "update")
+
+
+class SearchStats:
+    """Statistics collected over one call to MCTS.search.
+
+    The simulation, node and depth counts are always collected. Phase times and
+    the depth histogram are only collected when the MCTS is instrumented."""
+
+    def __init__(
+        self,
+        simulations=0,
+        nodes=0,
+        max_depth=0,
+        mean_depth=0,
+        elapsed=0,
+        tree_size=0,
+        tree_hits=0,
+        transpositions=0,
+        nn_calls=0,
+        nn_latency=0,
+        phase_times=None,
+        depth_histogram=None,
+        stopped_early=False,
+    ):
+        self.simulations = simulations
+        self.nodes = nodes
+        self.max_depth = max_depth
+        self.mean_depth = mean_depth
+        self.elapsed = elapsed
+        self.tree_size = tree_size
+        self.tree_hits = tree_hits
+        self.transpositions = transpositions
+        self.nn_calls = nn_calls
+        self.nn_latency = nn_latency
+        self.phase_times = phase_times or dict.fromkeys(PHASES, 0.0)
+        self.depth_histogram = depth_histogram or {}
+        self.stopped_early = stopped_early
+
+    @property
+    def simulations_per_second(self):
+        if self.elapsed == 0:
+            return 0
+
+        return self.simulations / self.elapsed
+
+    @property
+    def mean_nn_latency(self):
+        if self.nn_calls == 0:
+            return 0
+
+        return self.nn_latency / self.nn_calls
+
+    @classmethod
+    def combine(cls, stats, elapsed):
+        """Combines the statistics of searches that ran side by side.
+
+        Arguments:
+            stats {list[SearchStats]} -- The statistics to combine
+            elapsed {float} -- The wall time spent on all searches
+
+        Returns:
+            SearchStats -- The combined statistics
+        """
+        simulations = sum(s.simulations for s in stats)
+        phase_times = dict.fromkeys(PHASES, 0.0)
+        depth_histogram = {}
+        for s in stats:
+            for phase, seconds in s.phase_times.items():
+                phase_times[phase] += seconds
+            for depth, count in s.depth_histogram.items():
+                depth_histogram[depth] = depth_histogram.get(depth, 0) + count
+
+        return cls(
+            simulations=simulations,
+            nodes=sum(s.nodes for s in stats),
+            max_depth=max([s.max_depth for s in stats] + [0]),
+            mean_depth=sum(s.mean_depth * s.simulations for s in stats)
+            / max(simulations, 1),
+            elapsed=elapsed,
+            tree_size=sum(s.tree_size for s in stats),
+            tree_hits=sum(s.tree_hits for s in stats),
+            transpositions=sum(s.transpositions for s in stats),
+            nn_calls=sum(s.nn_calls for s in stats),
+            nn_latency=sum(s.nn_latency for s in stats),
+            phase_times=phase_times,
+            depth_histogram=depth_histogram,
+            stopped_early=any(s.stopped_early for s in stats),
+        )
+
+    def as_dict(self):
+        """Returns the statistics as a flat dictionary of numbers, for metrics exporters."""
+        stats = {
+            "simulations": self.simulations,
+            "simulations_per_second": self.simulations_per_second,
+            "nodes": self.nodes,
+            "tree_size": self.tree_size,
+            "tree_hits": self.tree_hits,
+            "transpositions": self.transpositions,
+            "max_depth": self.max_depth,
+            "mean_depth": self.mean_depth,
+            "elapsed": self.elapsed,
+            "nn_calls": self.nn_calls,
+            "nn_latency": self.nn_latency,
+            "mean_nn_latency": self.mean_nn_latency,
+            "stopped_early": self.stopped_early,
+        }
+        for phase, seconds in self.phase_times.items():
+            stats["time_" + phase] = seconds
+
+        return stats
+
+    def __repr__(self):
+        return "SearchStats(simulations={}, nodes={}, max_depth={}, mean_depth={:.2f}, elapsed={:.3f})".format(
+            self.simulations, self.nodes, self.max_depth, self.mean_depth, self.elapsed
+        )
@@ -0,0 +1,634 @@
+import numpy as np
+from .base import BaseTree
+
+# Approximate memory overhead of a node and of an edge, excluding the state array
+_NODE_BYTES = 300
+_EDGE_BYTES = 56
+
+
+def _grow(array, size):
+    """Returns `array` resized to hold at least `size` entries.
+
+    Capacity is doubled so that repeated appends are amortized O(1)."""
+    if size <= array.shape[0]:
+        return array
+
+    capacity = max(size, 2 * array.shape[0])
+    grown = np.empty(capacity, dtype=array.dtype)
+    grown[: array.shape[0]] = array
+    return grown
+
+
+class ArrayEdge:
+    """A view of a single edge in an ArrayGameTree.
+
+    Exposes the same attributes as mcts.tree.gametree.Edge, but all
+    statistics live in the arrays of the owning tree."""
+
+    __slots__ = ("_tree", "_index", "_parent")
+
+    def __init__(self, tree, index, parent):
+        self._tree = tree
+        self._index = index
+        self._parent = parent
+
+    @property
+    def action(self):
+        return int(self._tree._actions[self._index])
+
+    @property
+    def n(self):
+        return int(self._tree._n[self._index])
+
+    @n.setter
+    def n(self, value):
+        tree = self._tree
+        tree._visits[self._parent] += value - tree._n[self._index]
+        tree._n[self._index] = value
+
+    @property
+    def w(self):
+        return float(self._tree._w[self._index])
+
+    @w.setter
+    def w(self, value):
+        self._tree._w[self._index] = value
+
+    @property
+    def p(self):
+        return float(self._tree._p[self._index])
+
+    @p.setter
+    def p(self, value):
+        self._tree._p[self._index] = value
+
+    @property
+    def proof(self):
+        return float(self._tree._proof[self._index])
+
+    @proof.setter
+    def proof(self, value):
+        self._tree._proof[self._index] = value
+
+    @property
+    def amaf_n(self):
+        return int(self._tree._amaf_n[self._index])
+
+    @property
+    def amaf_w(self):
+        return float(self._tree._amaf_w[self._index])
+
+    @property
+    def q(self):
+        n = self._tree._n[self._index]
+        if n == 0:
+            return 0
+
+        return float(self._tree._w[self._index] / n)
+
+    @property
+    def evaluated(self):
+        return bool(self._tree._child[self._index] >= 0)
+
+    @property
+    def node(self):
+        child = self._tree._child[self._index]
+        if child < 0:
+            raise AttributeError("Edge has not been evaluated.")
+
+        return ArrayNode(self._tree, int(child))
+
+    def evaluate(self, node):
+        self._tree._child[self._index] = node.index
+
+
+class ArrayNode:
+    """A view of a single node in an ArrayGameTree.
+
+    A node is an integer offset into the node arrays of the tree. Its edges
+    occupy a contiguous block of the edge arrays, sorted by action. The `actions`,
+    `n`, `w` and `p` attributes are views of that block, and `visits` is the
+    total visit count of the node."""
+
+    __slots__ = ("_tree", "index")
+
+    def __init__(self, tree, index):
+        self._tree = tree
+        self.index = index
+
+    @property
+    def id(self):
+        return self._tree._ids[self.index]
+
+    @property
+    def state(self):
+        return self._tree._states[self.index]
+
+    @property
+    def player(self):
+        return self._tree._players[self.index]
+
+    @property
+    def expanded(self):
+        return bool(self._tree._expanded[self.index])
+
+    @expanded.setter
+    def expanded(self, value):
+        self._tree._expanded[self.index] = value
+
+    @property
+    def actions(self):
+        start, stop = self._tree._edge_range(self.index)
+        return self._tree._actions[start:stop]
+
+    @property
+    def n(self):
+        start, stop = self._tree._edge_range(self.index)
+        return self._tree._n[start:stop]
+
+    @property
+    def w(self):
+        start, stop = self._tree._edge_range(self.index)
+        return self._tree._w[start:stop]
+
+    @property
+    def p(self):
+        start, stop = self._tree._edge_range(self.index)
+        return self._tree._p[start:stop]
+
+    @property
+    def proof(self):
+        start, stop = self._tree._edge_range(self.index)
+        return self._tree._proof[start:stop]
+
+    @property
+    def amaf_n(self):
+        start, stop = self._tree._edge_range(self.index)
+        return self._tree._amaf_n[start:stop]
+
+    @property
+    def amaf_w(self):
+        start, stop = self._tree._edge_range(self.index)
+        return self._tree._amaf_w[start:stop]
+
+    @property
+    def visits(self):
+        return int(self._tree._visits[self.index])
+
+    @property
+    def edges(self):
+        start, stop = self._tree._edge_range(self.index)
+        actions = self._tree._actions
+        return {
+            int(actions[i]): ArrayEdge(self._tree, i, self.index)
+            for i in range(start, stop)
+        }
+
+    @property
+    def value(self):
+        value = self._tree._value[self.index]
+        if np.isnan(value):
+            raise AttributeError("Node value has not been set.")
+
+        return float(value)
+
+    @value.setter
+    def value(self, value):
+        self._tree._value[self.index] = value
+
+    @property
+    def pending(self):
+        return self._tree._pending.get(self.index)
+
+    @pending.setter
+    def pending(self, value):
+        if value is None:
+            self._tree._pending.pop(self.index, None)
+        else:
+            self._tree._pending[self.index] = value
+
+    def set_edges(self, actions, priors=[]):
+        """Sets the edges of the node"""
+        self._tree._set_edges(self.index, actions, priors)
+
+    def add_edges(self, actions, priors=[]):
+        """Adds edges to an expanded node, keeping the statistics of the existing edges"""
+        self._tree._add_edges(self.index, actions, priors)
+
+    def set_value(self, value):
+        """Sets the value of the node.
+        Not all implementations of MCTS require that nodes have this attribute. Whether or not
+        To use a value will be determined by the expansion policy."""
+        self.value = value
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other):
+        return self.id == other.id
+
+    def __getitem__(self, action):
+        return ArrayEdge(
+            self._tree, self._tree._edge_index(self.index, action), self.index
+        )
+
+
+class ArrayGameTree(BaseTree):
+    """A struct-of-arrays game tree for the MCTS.
+
+    Edge statistics (N, W, P, proof, AMAF and child index) are kept in contiguous, growable
+    numpy arrays and nodes are integer offsets into the node arrays. Nodes and
+    edges handed out by the tree are thin views, so existing policies can use
+    them exactly like mcts.tree.gametree.Node and Edge.
+
+    Keyword Arguments:
+        initial_capacity {int} -- Initial size of the node and edge arrays (default: {1024})
+        capacity {int} -- Maximum number of nodes to hold (default: {None})
+        max_bytes {int} -- Approximate maximum memory footprint of the nodes (default: {None})
+        eviction {str or callable} -- Eviction policy used when a bound is reached (default: {"lru"})
+        symmetries {bool} -- Key nodes by the canonical form of their state when the environment declares symmetries (default: {False})
+    """
+
+    def __init__(
+        self,
+        initial_capacity=1024,
+        capacity=None,
+        max_bytes=None,
+        eviction="lru",
+        symmetries=False,
+    ):
+        super().__init__(
+            capacity=capacity,
+            max_bytes=max_bytes,
+            eviction=eviction,
+            symmetries=symmetries,
+        )
+        self._initial_capacity = initial_capacity
+        self.reset()
+
+    def evaluate(self, parent_id, action, state, player=None, key=None):
+        """Adds a node to the node tree if
+        the node is not already present
+
+        @returns node: Node added to tree"""
+        misses = self.misses
+        node = self.get_by_state(state, player=player, key=key)
+
+        edge = self._edge_index(self._index[parent_id], action)
+        if self._child[edge] < 0:
+            self._child[edge] = node.index
+            if self.misses == misses:
+                # A new edge into an existing node is a transposition
+                self.transpositions += 1
+
+        return node
+
+    def get_by_id(self, node_id):
+        """Retrieves a node by the node ID"""
+        index = self._index[node_id]
+        self._touch(index)
+        return ArrayNode(self, index)
+
+    def get_by_state(self, state, player=None, key=None):
+        """Retrieves a node by the associated state.
+
+        If a node associated to that state does not exist,
+        a node is made and put in the game tree.
+
+        If the environment provides a `hash_key`, pass it as `key`
+        to identify the state without hashing the state array."""
+        state_id = self.state_id(state, key)
+
+        index = self._index.get(state_id)
+        if index is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self._make_room(_NODE_BYTES + state.nbytes)
+            index = self._add_node(state_id, state, player)
+
+        self._touch(index)
+        return ArrayNode(self, index)
+
+    def reroot(self, root, keep=()):
+        """Makes `root` the root of the tree and releases every node outside of its subtree.
+
+        Nodes whose ids are in `keep` are retained with their statistics, but their edges
+        to released nodes are reset to unevaluated. The arrays are compacted in one pass,
+        so views created before rerooting are invalidated.
+
+        @returns node: The root node in the rerooted tree"""
+        retained = np.zeros(self._n_nodes, dtype=bool)
+        retained[root.index] = True
+
+        frontier = np.array([root.index], dtype=np.int64)
+        while frontier.size:
+            children = self._child[self._gather_edges(frontier)]
+            children = np.unique(children[children >= 0])
+            frontier = children[~retained[children]]
+            retained[frontier] = True
+
+        for node_id in keep:
+            index = self._index.get(node_id)
+            if index is not None:
+                retained[index] = True
+
+        root_id = root.id
+        self._compact(np.flatnonzero(retained))
+        return self.get_by_id(root_id)
+
+    def reset(self):
+        capacity = self._initial_capacity
+
+        # Node arrays
+        self._index = {}
+        self._ids = []
+        self._states = []
+        self._players = []
+        self._live = np.zeros(capacity, dtype=bool)
+        self._expanded = np.zeros(capacity, dtype=bool)
+        self._value = np.full(capacity, np.nan)
+        self._edge_start = np.zeros(capacity, dtype=np.int64)
+        self._edge_count = np.zeros(capacity, dtype=np.int32)
+        self._visits = np.zeros(capacity, dtype=np.int64)
+        self._last_access = np.zeros(capacity, dtype=np.int64)
+        self._generation = np.zeros(capacity, dtype=np.int64)
+        self._free = []
+        self._n_nodes = 0
+
+        # Actions held back by progressive widening, by node index
+        self._pending = {}
+
+        # Edge arrays
+        self._actions = np.zeros(capacity, dtype=np.int64)
+        self._n = np.zeros(capacity, dtype=np.int64)
+        self._w = np.zeros(capacity, dtype=np.float64)
+        self._p = np.zeros(capacity, dtype=np.float32)
+        self._proof = np.full(capacity, np.nan, dtype=np.float32)
+        self._amaf_n = np.zeros(capacity, dtype=np.int64)
+        self._amaf_w = np.zeros(capacity, dtype=np.float64)
+        self._child = np.full(capacity, -1, dtype=np.int64)
+        self._n_edges = 0
+        self._orphaned_edges = 0
+
+        self._reset_bookkeeping()
+
+    def __len__(self):
+        return self._n_nodes - len(self._free)
+
+    def __contains__(self, node_id):
+        return node_id in self._index
+
+    def _touch(self, index):
+        self._last_access[index] = self._tick
+        self._generation[index] = self.generation
+        self._tick += 1
+
+    def _add_node(self, state_id, state, player):
+        # Reuse the slot of an evicted node if there is one
+        if self._free:
+            index = self._free.pop()
+            self._ids[index] = state_id
+            self._states[index] = state
+            self._players[index] = player
+        else:
+            index = self._n_nodes
+            size = index + 1
+
+            if size > self._expanded.shape[0]:
+                self._live = _grow(self._live, size)
+                self._expanded = _grow(self._expanded, size)
+                self._value = _grow(self._value, size)
+                self._edge_start = _grow(self._edge_start, size)
+                self._edge_count = _grow(self._edge_count, size)
+                self._visits = _grow(self._visits, size)
+                self._last_access = _grow(self._last_access, size)
+                self._generation = _grow(self._generation, size)
+
+            self._ids.append(state_id)
+            self._states.append(state)
+            self._players.append(player)
+            self._n_nodes = size
+
+        self._live[index] = True
+        self._expanded[index] = False
+        self._value[index] = np.nan
+        self._edge_start[index] = 0
+        self._edge_count[index] = 0
+        self._visits[index] = 0
+        self._index[state_id] = index
+
+        return index
+
+    def _set_edges(self, index, actions, priors):
+        actions = np.asarray(actions, dtype=np.int64)
+        order = np.argsort(actions, kind="stable")
+        count = actions.shape[0]
+
+        # Edges are only ever appended. Re-expanding a node orphans its old block.
+        start = self._allocate_edges(count)
+        size = start + count
+
+        self._actions[start:size] = actions[order]
+        self._n[start:size] = 0
+        self._w[start:size] = 0
+        if len(priors) == 0:
+            self._p[start:size] = 0
+        else:
+            self._p[start:size] = np.asarray(priors)[order]
+        self._proof[start:size] = np.nan
+        self._amaf_n[start:size] = 0
+        self._amaf_w[start:size] = 0
+        self._child[start:size] = -1
+
+        self._edge_start[index] = start
+        self._edge_count[index] = count
+        self._visits[index] = 0
+
+    def _add_edges(self, index, actions, priors):
+        """Moves the edges of a node to a new block with room for `actions`."""
+        old_start, old_stop = self._edge_range(index)
+        old_count = old_stop - old_start
+        actions = np.asarray(actions, dtype=np.int64)
+        if len(priors) == 0:
+            priors = np.zeros(actions.shape[0])
+
+        count = old_count + actions.shape[0]
+        start = self._allocate_edges(count)
+        size = start + count
+        edges = np.arange(old_start, old_stop)
+
+        merged = np.concatenate([self._actions[edges], actions])
+        order = np.argsort(merged, kind="stable")
+        self._actions[start:size] = merged[order]
+        self._n[start:size] = np.concatenate(
+            [self._n[edges], np.zeros(actions.shape[0], dtype=np.int64)]
+        )[order]
+        self._w[start:size] = np.concatenate(
+            [self._w[edges], np.zeros(actions.shape[0])]
+        )[order]
+        self._p[start:size] = np.concatenate([self._p[edges], priors])[order]
+        self._proof[start:size] = np.concatenate(
+            [self._proof[edges], np.full(actions.shape[0], np.nan)]
+        )[order]
+        self._amaf_n[start:size] = np.concatenate(
+            [self._amaf_n[edges], np.zeros(actions.shape[0], dtype=np.int64)]
+        )[order]
+        self._amaf_w[start:size] = np.concatenate(
+            [self._amaf_w[edges], np.zeros(actions.shape[0])]
+        )[order]
+        self._child[start:size] = np.concatenate(
+            [self._child[edges], np.full(actions.shape[0], -1, dtype=np.int64)]
+        )[order]
+
+        self._edge_start[index] = start
+        self._edge_count[index] = count
+
+        # Reclaim the orphaned blocks once they dominate
+        self._orphaned_edges += old_count
+        if 2 * self._orphaned_edges > self._n_edges:
+            self._compact_edges()
+
+    def _allocate_edges(self, count):
+        """Returns the start of a new block of `count` edges at the end of the edge arrays."""
+        start = self._n_edges
+        size = start + count
+
+        if size > self._actions.shape[0]:
+            self._actions = _grow(self._actions, size)
+            self._n = _grow(self._n, size)
+            self._w = _grow(self._w, size)
+            self._p = _grow(self._p, size)
+            self._proof = _grow(self._proof, size)
+            self._amaf_n = _grow(self._amaf_n, size)
+            self._amaf_w = _grow(self._amaf_w, size)
+            self._child = _grow(self._child, size)
+
+        self._n_edges = size
+        return start
+
+    def _gather_edges(self, indices):
+        """Returns the edge indices of every node in `indices`, block by block."""
+        starts = self._edge_start[indices]
+        counts = self._edge_count[indices].astype(np.int64)
+        block_starts = np.cumsum(counts) - counts
+        return np.repeat(starts - block_starts, counts) + np.arange(counts.sum())
+
+    def _compact(self, indices):
+        """Keeps only the nodes in `indices` and rewrites the arrays contiguously."""
+        remap = np.full(self._n_nodes, -1, dtype=np.int64)
+        remap[indices] = np.arange(indices.shape[0])
+
+        edges = self._gather_edges(indices)
+        counts = self._edge_count[indices]
+        children = self._child[edges]
+        evaluated = children >= 0
+        children[evaluated] = remap[children[evaluated]]
+
+        self._ids = [self._ids[i] for i in indices]
+        self._states = [self._states[i] for i in indices]
+        self._players = [self._players[i] for i in indices]
+        self._index = {node_id: i for i, node_id in enumerate(self._ids)}
+        self._live = self._live[indices]
+        self._expanded = self._expanded[indices]
+        self._value = self._value[indices]
+        self._edge_start = np.cumsum(counts, dtype=np.int64) - counts
+        self._edge_count = counts
+        self._visits = self._visits[indices]
+        self._last_access = self._last_access[indices]
+        self._generation = self._generation[indices]
+        self._free = []
+        self._n_nodes = indices.shape[0]
+        self._pending = {
+            int(remap[i]): pending
+            for i, pending in self._pending.items()
+            if remap[i] >= 0
+        }
+
+        self._actions = self._actions[edges]
+        self._n = self._n[edges]
+        self._w = self._w[edges]
+        self._p = self._p[edges]
+        self._proof = self._proof[edges]
+        self._amaf_n = self._amaf_n[edges]
+        self._amaf_w = self._amaf_w[edges]
+        self._child = children
+        self._n_edges = edges.shape[0]
+        self._orphaned_edges = 0
+
+    def _compact_edges(self):
+        """Rewrites the edge arrays without the blocks orphaned by evictions.
+
+        Node indices are unchanged, so existing node views stay valid."""
+        indices = np.flatnonzero(self._live[: self._n_nodes])
+        edges = self._gather_edges(indices)
+        counts = self._edge_count[indices]
+
+        self._edge_start[indices] = np.cumsum(counts, dtype=np.int64) - counts
+        self._actions = self._actions[edges]
+        self._n = self._n[edges]
+        self._w = self._w[edges]
+        self._p = self._p[edges]
+        self._proof = self._proof[edges]
+        self._amaf_n = self._amaf_n[edges]
+        self._amaf_w = self._amaf_w[edges]
+        self._child = self._child[edges]
+        self._n_edges = edges.shape[0]
+        self._orphaned_edges = 0
+
+    def _eviction_candidates(self):
+        indices = np.flatnonzero(self._live[: self._n_nodes])
+        counts = self._edge_count[indices]
+        edges = self._gather_edges(indices)
+        owner = np.repeat(np.arange(indices.shape[0]), counts)
+        evaluated = np.bincount(
+            owner, weights=self._child[edges] >= 0, minlength=indices.shape[0]
+        )
+
+        state_bytes = np.array([self._states[i].nbytes for i in indices])
+        candidates = {
+            "visits": self._visits[indices],
+            "leaf": evaluated == 0,
+            "last_access": self._last_access[indices],
+            "generation": self._generation[indices],
+            "nbytes": _NODE_BYTES + state_bytes + counts * _EDGE_BYTES,
+            "pinned": np.array([self._ids[i] in self._pins for i in indices], dtype=bool),
+        }
+
+        return indices, candidates
+
+    def _remove(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        for i in indices:
+            del self._index[self._ids[i]]
+            self._ids[i] = None
+            self._states[i] = None
+            self._players[i] = None
+            self._pending.pop(i, None)
+
+        self._live[indices] = False
+        self._edge_count[indices] = 0
+        self._free.extend(indices.tolist())
+
+        # Edges into evicted nodes become unevaluated again
+        children = self._child[: self._n_edges]
+        evaluated = np.flatnonzero(children >= 0)
+        dead = ~self._live[children[evaluated]]
+        children[evaluated[dead]] = -1
+
+        # Evicted nodes orphan their edge blocks. Reclaim them once they dominate.
+        live_edges = self._edge_count[: self._n_nodes][self._live[: self._n_nodes]].sum()
+        if self._n_edges > 2 * live_edges:
+            self._compact_edges()
+
+    def _edge_range(self, index):
+        start = int(self._edge_start[index])
+        return start, start + int(self._edge_count[index])
+
+    def _edge_index(self, index, action):
+        start, stop = self._edge_range(index)
+        i = start + int(np.searchsorted(self._actions[start:stop], action))
+        if i >= stop or self._actions[i] != action:
+            raise KeyError(action)
+
+        return i
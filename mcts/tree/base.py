@@ -0,0 +1,182 @@
+import numpy as np
+import xxhash
+from .eviction import EVICTION_POLICIES
+
+# Fraction of the capacity freed by a single eviction pass.
+# Evicting in batches amortizes the scan over the tree.
+_EVICTION_FRACTION = 0.05
+
+
+class BaseTree:
+    """Capacity and eviction bookkeeping shared by the game tree backends.
+
+    A tree may be bounded by a node count (`capacity`), by an estimate of its
+    memory footprint (`max_bytes`), or both. When a new node would exceed a
+    bound, a batch of nodes is evicted in the order given by the `eviction`
+    policy. Pinned nodes are never evicted.
+
+    With `symmetries`, nodes are keyed by the canonical form of their state under
+    the symmetries the environment declares, so symmetric states share a node.
+    The actions of such a node are in the frame of its canonical state. Environments
+    with a `canonical_key` method give the key and symmetry without the state.
+
+    Subclasses implement `__len__`, `__contains__`, `_eviction_candidates` and `_remove`."""
+
+    def __init__(
+        self, capacity=None, max_bytes=None, eviction="lru", symmetries=False
+    ):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.symmetries = symmetries
+
+        if isinstance(eviction, str):
+            if eviction not in EVICTION_POLICIES:
+                raise ValueError("{} is not a supported eviction policy.".format(eviction))
+            eviction = EVICTION_POLICIES[eviction]()
+        self.eviction = eviction
+
+    @staticmethod
+    def state_id(state, key=None):
+        """Returns the id of the node for a state.
+
+        This is `key` if the environment provides a `hash_key`, and a hash of the
+        state array otherwise."""
+        return key if key is not None else xxhash.xxh64(state).digest()
+
+    def node_key(self, environment, state):
+        """Returns what the node for a state of `environment` is stored under.
+
+        If `state` is None, it is read from the environment only when it is needed:
+        to compute the id or the canonical form, or to make a new node. The returned
+        state is then None if the node already exists.
+
+        Arguments:
+            environment {object} -- The environment, in the state `state`
+            state {numpy.array} -- The state of the environment, or None
+
+        Returns:
+            tuple -- The state and id of the node, and the index of the symmetry that maps
+                `state` to the node's state, or None if the tree does not use symmetries
+        """
+        if self.symmetries and hasattr(environment, "symmetries"):
+            canonical_key = getattr(environment, "canonical_key", None)
+            if canonical_key is None:
+                if state is None:
+                    state = environment.state
+                return self.canonical_form(environment, state)
+
+            # The key and symmetry come without the state, which is only transformed for a new node
+            key, symmetry = canonical_key()
+            if state is None:
+                if key in self:
+                    return None, key, symmetry
+                state = environment.state
+            return environment.transform_state(state, symmetry), key, symmetry
+
+        key = getattr(environment, "hash_key", None)
+        if state is None and (key is None or key not in self):
+            state = environment.state
+
+        return state, key, None
+
+    @staticmethod
+    def canonical_form(environment, state):
+        """Returns the canonical form of a state under the symmetries of its environment.
+
+        The canonical form is the transformed state with the smallest hash. Nodes keyed
+        by it are shared by all symmetric variants of a state. The player on move is
+        part of the id, since the same state may be reached with either player to move.
+
+        Arguments:
+            environment {object} -- An environment with `symmetries` and `transform_state`
+            state {numpy.array} -- The state to canonicalize, with `environment.player` on move
+
+        Returns:
+            tuple -- The canonical state, its id and the index of the symmetry that maps `state` to it
+        """
+        best = None
+        for symmetry in range(len(environment.symmetries)):
+            transformed = np.ascontiguousarray(
+                environment.transform_state(state, symmetry)
+            )
+            digest = xxhash.xxh64(transformed).digest()
+            if best is None or digest < best[1]:
+                best = (transformed, digest, symmetry)
+
+        transformed, digest, symmetry = best
+        player = str(environment.player).encode()
+        return transformed, xxhash.xxh64(digest + player).digest(), symmetry
+
+    def pin(self, node_id):
+        """Protects a node from eviction until it is unpinned.
+
+        Pins are counted, so a node pinned twice must be unpinned twice."""
+        self._pins[node_id] = self._pins.get(node_id, 0) + 1
+
+    def unpin(self, node_id):
+        count = self._pins[node_id] - 1
+        if count:
+            self._pins[node_id] = count
+        else:
+            del self._pins[node_id]
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0
+
+        return self.hits / lookups
+
+    def _reset_bookkeeping(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.transpositions = 0
+        self.generation = 0
+        self._tick = 0
+        self._pins = {}
+        self._nbytes = 0
+        self._node_nbytes = 0
+
+    def _make_room(self, nbytes):
+        """Evicts nodes if adding a node of roughly `nbytes` would exceed a bound."""
+        full = self.capacity is not None and len(self) >= self.capacity
+
+        if self.max_bytes is not None:
+            # Expansions grow nodes after they are added, so the running total is
+            # only an estimate between eviction passes. Each pass measures it exactly.
+            self._nbytes += max(nbytes, self._node_nbytes)
+            full = full or self._nbytes >= self.max_bytes
+
+        if full:
+            self._evict()
+            if self.max_bytes is not None:
+                self._nbytes += nbytes
+
+    def _evict(self):
+        keys, candidates = self._eviction_candidates()
+        nbytes = candidates["nbytes"]
+        keep_fraction = 1 - _EVICTION_FRACTION
+
+        order = self.eviction(candidates)
+        order = order[~candidates["pinned"][order]]
+
+        n_evict = 0
+        if self.capacity is not None:
+            n_evict = len(keys) + 1 - int(self.capacity * keep_fraction)
+
+        if self.max_bytes is not None:
+            total = nbytes.sum()
+            excess = total - self.max_bytes * keep_fraction
+            if excess > 0:
+                freed = np.cumsum(nbytes[order])
+                n_evict = max(n_evict, int(np.searchsorted(freed, excess)) + 1)
+
+        victims = order[: max(n_evict, 0)]
+        self._remove([keys[i] for i in victims])
+        self.evictions += len(victims)
+
+        if self.max_bytes is not None:
+            self._nbytes = total - nbytes[victims].sum()
+            self._node_nbytes = total / max(len(keys), 1)
@@ -0,0 +1,42 @@
+import numpy as np
+
+
+class LRUEviction:
+    """Evicts the least recently accessed nodes first."""
+
+    def __call__(self, candidates):
+        """Orders nodes for eviction.
+
+        Arguments:
+            candidates {dict} -- Arrays of per-node statistics: `visits`, `leaf`,
+                `last_access`, `generation` and `nbytes`.
+
+        Returns:
+            numpy.array -- Candidate indices, first to be evicted first.
+        """
+        return np.argsort(candidates["last_access"], kind="stable")
+
+
+class LowVisitEviction:
+    """Evicts leaves with the fewest visits first, then interior nodes with the fewest visits."""
+
+    def __call__(self, candidates):
+        return np.lexsort(
+            (candidates["last_access"], candidates["visits"], ~candidates["leaf"])
+        )
+
+
+class GenerationEviction:
+    """Evicts nodes that were last touched by the oldest search first.
+
+    Ties within a generation are broken by visit count."""
+
+    def __call__(self, candidates):
+        return np.lexsort((candidates["visits"], candidates["generation"]))
+
+
+EVICTION_POLICIES = {
+    "lru": LRUEviction,
+    "low-visit": LowVisitEviction,
+    "generation": GenerationEviction,
+}
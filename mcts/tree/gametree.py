@@ -1,53 +1,143 @@
 from sortedcontainers import SortedList
+import numpy as np
+import weakref
 import xxhash
+from .base import BaseTree
+
+# Approximate memory overhead of a node, of the edge arrays of an expanded node
+# and of each edge, excluding the state array
+_NODE_BYTES = 400
+_EXPANDED_BYTES = 750
+_EDGE_BYTES = 159
 
 
 class Edge:
     """The edge class for the game tree.
     
-    This class stores the visit count, q-value and priors of edges in the tree.
-    When evaluated, an edge will point to a Node."""
+    This class exposes the visit count, q-value and priors of edges in the tree.
+    The statistics themselves are stored in the arrays of the parent node, which
+    the edge refers to weakly so that released nodes are freed without the cyclic
+    garbage collector. When evaluated, an edge will point to a Node."""
+
+    __slots__ = ("_parent", "_index", "action", "evaluated", "node")
 
-    def __init__(self, action, prior=0):
+    def __init__(self, parent, index, action):
+        self._parent = weakref.proxy(parent)
+        self._index = index
         self.action = action
-        self.n = 0
-        self.w = 0
-        self.p = prior
         self.evaluated = False
 
+    @property
+    def n(self):
+        return int(self._parent.n[self._index])
+
+    @n.setter
+    def n(self, value):
+        parent = self._parent
+        parent.visits += value - parent.n[self._index]
+        parent.n[self._index] = value
+
+    @property
+    def w(self):
+        return float(self._parent.w[self._index])
+
+    @w.setter
+    def w(self, value):
+        self._parent.w[self._index] = value
+
+    @property
+    def p(self):
+        return float(self._parent.p[self._index])
+
+    @p.setter
+    def p(self, value):
+        self._parent.p[self._index] = value
+
+    @property
+    def proof(self):
+        return float(self._parent.proof[self._index])
+
+    @proof.setter
+    def proof(self, value):
+        self._parent.proof[self._index] = value
+
+    @property
+    def amaf_n(self):
+        return int(self._parent.amaf_n[self._index])
+
+    @property
+    def amaf_w(self):
+        return float(self._parent.amaf_w[self._index])
+
     def evaluate(self, node):
         self.evaluated = True
         self.node = node
 
+    def release(self):
+        """Drops the reference to the evaluated node."""
+        self.evaluated = False
+        del self.node
+
     @property
     def q(self):
-        if self.n == 0:
+        n = self._parent.n[self._index]
+        if n == 0:
             return 0
 
-        return self.w / self.n
+        return float(self._parent.w[self._index] / n)
 
 
 class Node:
     """The Node class for the game tree.
     
     This class stores the state information in the game tree. Each node will contain a list
-    of edges upon being expanded."""
+    of edges upon being expanded. The edge statistics are kept in per-node arrays
+    (`actions`, `n`, `w` and `p`) along with the total visit count `visits`, so that
+    policies can operate on all edges at once. The `proof` array holds the proven
+    value of each edge for the player on move (1, 0 or -1), or NaN if it is unproven.
+    The `amaf_n` and `amaf_w` arrays hold all-moves-as-first statistics for RAVE."""
 
-    def __init__(self, state, player=None):
-        self.id = xxhash.xxh64(state).digest()  # Used to identify state
+    def __init__(self, state, player=None, node_id=None):
+        if node_id is None:
+            node_id = xxhash.xxh64(state).digest()
+        self.id = node_id  # Used to identify state
         self.state = state
         self.player = player
         self.expanded = False
+        self.pending = None
 
     def set_edges(self, actions, priors=[]):
         """Sets the edges of the node"""
-        if priors == []:
-            self.edges = {action: Edge(action) for action in actions}
+        k = len(actions)
+        self.actions = np.asarray(actions)
+        self.n = np.zeros(k, dtype=np.int64)
+        self.w = np.zeros(k)
+        if len(priors) == 0:
+            self.p = np.zeros(k)
         else:
-            self.edges = {
-                actions[i]: Edge(actions[i], prior=priors[i])
-                for i in range(len(actions))
-            }
+            self.p = np.asarray(priors, dtype=np.float64)
+        self.proof = np.full(k, np.nan)
+        self.amaf_n = np.zeros(k, dtype=np.int64)
+        self.amaf_w = np.zeros(k)
+        self.visits = 0
+        self.edges = {action: Edge(self, i, action) for i, action in enumerate(actions)}
+
+    def add_edges(self, actions, priors=[]):
+        """Adds edges to an expanded node, keeping the statistics of the existing edges"""
+        k = len(self.actions)
+        self.actions = np.concatenate([self.actions, actions])
+        self.n = np.concatenate([self.n, np.zeros(len(actions), dtype=np.int64)])
+        self.w = np.concatenate([self.w, np.zeros(len(actions))])
+        if len(priors) == 0:
+            priors = np.zeros(len(actions))
+        self.p = np.concatenate([self.p, priors])
+        self.proof = np.concatenate([self.proof, np.full(len(actions), np.nan)])
+        self.amaf_n = np.concatenate(
+            [self.amaf_n, np.zeros(len(actions), dtype=np.int64)]
+        )
+        self.amaf_w = np.concatenate([self.amaf_w, np.zeros(len(actions))])
+        for i, action in enumerate(actions, k):
+            self.edges[action] = Edge(self, i, action)
 
     def set_value(self, value):
         """Sets the value of the node.
@@ -56,7 +146,7 @@ class Node:
         self.value = value
 
     def __hash__(self):
-        return self.id
+        return hash(self.id)
 
     def __eq__(self, other):
         return self.id == other.id
@@ -65,46 +155,157 @@ class Node:
         return self.edges[action]
 
 
-class GameTree:
-    """Contains the game tree for the MCTS"""
+class GameTree(BaseTree):
+    """Contains the game tree for the MCTS
 
-    def __init__(self):
-        self.nodes = {}
+    Keyword Arguments:
+        capacity {int} -- Maximum number of nodes to hold (default: {None})
+        max_bytes {int} -- Approximate maximum memory footprint of the nodes (default: {None})
+        eviction {str or callable} -- Eviction policy used when a bound is reached (default: {"lru"})
+        symmetries {bool} -- Key nodes by the canonical form of their state when the environment declares symmetries (default: {False})
+    """
+
+    def __init__(self, capacity=None, max_bytes=None, eviction="lru", symmetries=False):
+        super().__init__(
+            capacity=capacity,
+            max_bytes=max_bytes,
+            eviction=eviction,
+            symmetries=symmetries,
+        )
+        self.reset()
 
-    def evaluate(self, parent_id, action, state, player=None):
+    def evaluate(self, parent_id, action, state, player=None, key=None):
         """Adds a node to the node tree if 
         the node is not already present
         
         @returns node: Node added to tree"""
-        node = self.get_by_state(state, player=player)
+        misses = self.misses
+        node = self.get_by_state(state, player=player, key=key)
 
         # Evaluate the state-action pair given by
         # parent_id, action if this pair has not already
         # been evaluated.
         if not self.nodes[parent_id][action].evaluated:
             self.nodes[parent_id][action].evaluate(node)
+            if self.misses == misses:
+                # A new edge into an existing node is a transposition
+                self.transpositions += 1
 
         return node
 
     def get_by_id(self, node_id):
         """Retrieves a node by the node ID"""
-        return self.nodes[node_id]
+        node = self.nodes[node_id]
+        self._touch(node)
+        return node
 
-    def get_by_state(self, state, player=None):
+    def get_by_state(self, state, player=None, key=None):
         """Retrieves a node by the associated state.
         
         If a node associated to that state does not exist,
-        a node is made and put in the game tree."""
-        state_id = xxhash.xxh64(state).digest()
+        a node is made and put in the game tree.
+
+        If the environment provides a `hash_key`, pass it as `key`
+        to identify the state without hashing the state array."""
+        state_id = self.state_id(state, key)
 
         node = self.nodes.get(state_id)
         if node:
+            self.hits += 1
+            self._touch(node)
             return node
 
         else:
-            node = Node(state, player=player)
+            self.misses += 1
+            self._make_room(_NODE_BYTES + state.nbytes)
+            node = Node(state, player=player, node_id=state_id)
             self.nodes[state_id] = node
+            self._touch(node)
             return node
 
+    def reroot(self, root, keep=()):
+        """Makes `root` the root of the tree and releases every node outside of its subtree.
+
+        Nodes whose ids are in `keep` are retained with their statistics, but their edges
+        to released nodes are reset to unevaluated.
+
+        @returns node: The root node in the rerooted tree"""
+        nodes = {root.id: root}
+        frontier = [root]
+        while frontier:
+            node = frontier.pop()
+            if not node.expanded:
+                continue
+
+            for edge in node.edges.values():
+                if edge.evaluated and edge.node.id not in nodes:
+                    nodes[edge.node.id] = edge.node
+                    frontier.append(edge.node)
+
+        for node_id in keep:
+            node = self.nodes.get(node_id)
+            if node is None or node_id in nodes:
+                continue
+
+            if node.expanded:
+                for edge in node.edges.values():
+                    if edge.evaluated and edge.node.id not in nodes:
+                        edge.release()
+            nodes[node_id] = node
+
+        self.nodes = nodes
+        return root
+
     def reset(self):
         self.nodes = {}
+        self._reset_bookkeeping()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node_id):
+        return node_id in self.nodes
+
+    def _touch(self, node):
+        node.last_access = self._tick
+        node.generation = self.generation
+        self._tick += 1
+
+    def _eviction_candidates(self):
+        keys = list(self.nodes)
+        n = len(keys)
+        candidates = {
+            "visits": np.zeros(n),
+            "leaf": np.ones(n, dtype=bool),
+            "last_access": np.zeros(n, dtype=np.int64),
+            "generation": np.zeros(n, dtype=np.int64),
+            "nbytes": np.zeros(n),
+            "pinned": np.zeros(n, dtype=bool),
+        }
+
+        for i, node in enumerate(self.nodes.values()):
+            nbytes = _NODE_BYTES + node.state.nbytes
+            if node.expanded:
+                edges = node.edges.values()
+                nbytes += _EXPANDED_BYTES + len(edges) * _EDGE_BYTES
+                candidates["visits"][i] = node.visits
+                candidates["leaf"][i] = not any(edge.evaluated for edge in edges)
+
+            candidates["last_access"][i] = node.last_access
+            candidates["generation"][i] = node.generation
+            candidates["nbytes"][i] = nbytes
+            candidates["pinned"][i] = node.id in self._pins
+
+        return keys, candidates
+
+    def _remove(self, node_ids):
+        for node_id in node_ids:
+            del self.nodes[node_id]
+
+        # Release edges into evicted nodes so that their memory can be reclaimed.
+        # They will be re-evaluated if the search reaches them again.
+        for node in self.nodes.values():
+            if node.expanded:
+                for edge in node.edges.values():
+                    if edge.evaluated and edge.node.id not in self.nodes:
+                        edge.release()
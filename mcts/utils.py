@@ -11,6 +11,22 @@ def play_game(mcts):
     return game_history, reward, winner
 
 
+def valid_actions(actions):
+    """Returns valid actions as an array of actions.
+
+    Arguments:
+        actions {list or numpy.array} -- A list of actions, or a boolean mask over the action space
+
+    Returns:
+        numpy.array -- The valid actions
+    """
+    actions = np.asarray(actions)
+    if actions.dtype == bool:
+        return np.flatnonzero(actions)
+
+    return actions
+
+
 def softmax(X, theta=1.0, axis=None):
     """
     Compute the softmax of each element along an axis of X.
@@ -88,3 +104,26 @@ def node_to_probability_distribution(node, t=0.1):
     arr[:, 1] = arr[:, 1] ** (1 / t) / np.sum(arr[:, 1] ** (1 / t))
 
     return arr
+
+
+def proven_value(node):
+    """Returns the proven value of a node for the player on move.
+
+    A node is a proven win if any of its edges is a proven win. Otherwise it is
+    proven once all of its actions are edges and all edges are proven, and its value
+    is that of its best edge.
+
+    Arguments:
+        node {mcts.tree.Node} -- An expanded node
+
+    Returns:
+        float -- 1 for a win, 0 for a draw, -1 for a loss, or NaN if the node is unproven
+    """
+    proof = node.proof
+    if (proof == 1).any():
+        return 1.0
+
+    if node.pending is not None or np.isnan(proof).any():
+        return np.nan
+
+    return float(proof.max())